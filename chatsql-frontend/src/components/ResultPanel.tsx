@@ -20,6 +20,12 @@ export default function ResultPanel({ queryResult, submitResult }: Props){
             <pre className="text-red-600">{queryResult.error}</pre>
           ) : (
             <div className="overflow-x-auto">
+              {queryResult.warning && (
+                <div className="mb-2 text-sm text-amber-700">{queryResult.warning}</div>
+              )}
+              {queryResult.truncated && (
+                <div className="mb-2 text-sm text-amber-700">Showing the first {queryResult.row_count} rows; the result was truncated.</div>
+              )}
               <table className="w-full table-auto text-sm">
                 <thead><tr>{queryResult.columns.map((c,i)=><th key={i} className="px-2 py-1 text-left">{c}</th>)}</tr></thead>
                 <tbody>{queryResult.rows.map((r,ri)=>(<tr key={ri}>{r.map((c,ci)=><td key={ci} className="px-2 py-1">{String(c)}</td>)}</tr>))}</tbody>
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -57,6 +58,10 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'chatsql.wsgi.application'
+ASGI_APPLICATION = 'chatsql.asgi.application'
+
+# 'sync' (default): DRF views + pymysql. 'async': async views + aiomysql, requires an ASGI server.
+SQL_EXECUTION_MODE = os.getenv('SQL_EXECUTION_MODE', 'sync')
 
 # Databases
 DB_NAME = os.getenv('DB_NAME')
@@ -66,6 +71,89 @@ WS_DB_USER = os.getenv('WS_DB_USER')
 WS_DB_PASSWORD = os.getenv('WS_DB_PASSWORD')
 WS_DB_HOST = os.getenv('WS_DB_HOST')
 WS_DB_PORT = os.getenv('WS_DB_PORT', '3306')
+# Read replicas of WS_DB_HOST, comma-separated host[:port] (port defaults to WS_DB_PORT)
+WS_DB_REPLICA_HOSTS = [h.strip() for h in os.getenv('WS_DB_REPLICA_HOSTS', '').split(',') if h.strip()]
+
+# Connection pool used by SQLExecutor for the practice databases (per alias)
+SQL_POOL_MAX_SIZE = int(os.getenv('SQL_POOL_MAX_SIZE', '10'))
+SQL_POOL_MAX_IDLE_TIME = int(os.getenv('SQL_POOL_MAX_IDLE_TIME', '300'))  # seconds
+SQL_POOL_MAX_LIFETIME = int(os.getenv('SQL_POOL_MAX_LIFETIME', '1800'))  # seconds
+SQL_POOL_CHECKOUT_TIMEOUT = float(os.getenv('SQL_POOL_CHECKOUT_TIMEOUT', '5'))  # seconds
+SQL_POOL_HEALTH_CHECK_INTERVAL = int(os.getenv('SQL_POOL_HEALTH_CHECK_INTERVAL', '30'))  # seconds
+
+# Read replicas per practice database alias (host[:port] lists). Student queries
+# are spread over the primary and its replicas by outstanding requests and latency;
+# a host is skipped for SQL_REPLICA_DOWN_TIME seconds after
+# SQL_REPLICA_FAILURE_THRESHOLD consecutive connection failures.
+# Filled from WS_DB_REPLICA_HOSTS for every alias on WS_DB_HOST below.
+SQL_READ_REPLICAS = {}
+SQL_REPLICA_INCLUDE_PRIMARY = os.getenv('SQL_REPLICA_INCLUDE_PRIMARY', 'True') == 'True'
+SQL_REPLICA_FAILURE_THRESHOLD = int(os.getenv('SQL_REPLICA_FAILURE_THRESHOLD', '3'))
+SQL_REPLICA_DOWN_TIME = int(os.getenv('SQL_REPLICA_DOWN_TIME', '30'))  # seconds
+
+# Upper bound for per-exercise statement time budgets (Exercise.time_limit), in seconds
+SQL_MAX_TIME_LIMIT = int(os.getenv('SQL_MAX_TIME_LIMIT', '30'))
+
+# EXPLAIN FORMAT=JSON pre-check before running student queries:
+# 'off' (default), 'warn' (run but attach a warning) or 'reject'.
+# Thresholds are estimated rows examined, per database alias with a 'default'.
+SQL_EXPLAIN_MODE = os.getenv('SQL_EXPLAIN_MODE', 'off')
+SQL_EXPLAIN_MAX_ROWS = {
+    'default': int(os.getenv('SQL_EXPLAIN_MAX_ROWS', '5000000')),
+}
+# Seconds a query's row estimate is reused before it is EXPLAINed again
+SQL_EXPLAIN_CACHE_TTL = int(os.getenv('SQL_EXPLAIN_CACHE_TTL', '600'))
+
+# In-process cache of Exercise.expected_sql results used when grading submissions
+EXPECTED_RESULT_CACHE_SIZE = int(os.getenv('EXPECTED_RESULT_CACHE_SIZE', '512'))
+EXPECTED_RESULT_CACHE_TTL = int(os.getenv('EXPECTED_RESULT_CACHE_TTL', '3600'))  # seconds
+
+# Threads used to run the expected query in parallel with the student's query on submit
+SUBMIT_PARALLEL_WORKERS = int(os.getenv('SUBMIT_PARALLEL_WORKERS', '16'))
+
+# Threads used per bulk re-grade (kept below SQL_POOL_MAX_SIZE to leave room for live traffic)
+REGRADE_WORKERS = int(os.getenv('REGRADE_WORKERS', '4'))
+
+# Admission control in front of the practice databases: concurrent queries per
+# alias and per session, plus a short fair queue; requests that can't get a slot
+# within SQL_ADMISSION_MAX_WAIT seconds are answered 429 with Retry-After.
+# A slot is one executing statement on one pooled connection (a Submit's
+# expected query takes its own), so the per-alias limit defaults to the pool size
+SQL_ADMISSION_ENABLED = os.getenv('SQL_ADMISSION_ENABLED', 'True') == 'True'
+SQL_ADMISSION_PER_DB = int(os.getenv('SQL_ADMISSION_PER_DB', str(SQL_POOL_MAX_SIZE)))
+SQL_ADMISSION_PER_SESSION = int(os.getenv('SQL_ADMISSION_PER_SESSION', '2'))
+SQL_ADMISSION_MAX_QUEUE = int(os.getenv('SQL_ADMISSION_MAX_QUEUE', '50'))
+SQL_ADMISSION_MAX_WAIT = float(os.getenv('SQL_ADMISSION_MAX_WAIT', '2'))  # seconds
+
+# Cached payloads of the list endpoints (schemas, exercises). Signals rebuild them
+# in the worker that saved the change; other workers pick it up after this many seconds
+API_LIST_CACHE_TTL = int(os.getenv('API_LIST_CACHE_TTL', '60'))
+
+# Exercise search index (title/description/tags), rebuilt after this many seconds
+# to pick up changes saved by other workers; saves in this worker update it in place
+SEARCH_INDEX_TTL = int(os.getenv('SEARCH_INDEX_TTL', '300'))
+
+# Table/column catalog of each practice database, reloaded after this many seconds
+SCHEMA_CATALOG_TTL = int(os.getenv('SCHEMA_CATALOG_TTL', '600'))
+
+# Read-through cache for student Run queries, keyed by alias + normalized SQL
+QUERY_RESULT_CACHE_ENABLED = os.getenv('QUERY_RESULT_CACHE_ENABLED', 'True') == 'True'
+QUERY_RESULT_CACHE_SIZE = int(os.getenv('QUERY_RESULT_CACHE_SIZE', '2048'))
+QUERY_RESULT_CACHE_TTL = int(os.getenv('QUERY_RESULT_CACHE_TTL', '300'))  # seconds
+QUERY_RESULT_CACHE_MAX_CELLS = int(os.getenv('QUERY_RESULT_CACHE_MAX_CELLS', '2000000'))
+# Concurrent identical queries (same alias, normalized SQL and time limit) share one execution
+QUERY_SINGLE_FLIGHT = os.getenv('QUERY_SINGLE_FLIGHT', 'True') == 'True'
+
+# Grading compares DECIMAL/FLOAT values rounded to this many places
+# (per-exercise override: Exercise.grading_options['decimal_places'])
+GRADING_DECIMAL_PLACES = int(os.getenv('GRADING_DECIMAL_PLACES', '6'))
+
+# Run/Submit on an in-memory SQLite copy of DatabaseSchema.schema_sql/seed_sql
+# when the query translates cleanly, falling back to MySQL otherwise. Off by
+# default: the translation covers common practice queries, not all of MySQL.
+SQL_LOCAL_SANDBOX = os.getenv('SQL_LOCAL_SANDBOX', 'False') == 'True'
+# Template snapshots of each schema, shared by the workers on one host ('' = in-memory only)
+SQL_SANDBOX_DIR = os.getenv('SQL_SANDBOX_DIR', os.path.join(tempfile.gettempdir(), 'chatsql-sandbox'))
 
 # If DB_NAME is provided via env, configure MySQL databases as in the docs.
 # Otherwise, fall back to a local SQLite DB for quick local development.
@@ -202,6 +290,12 @@ if DB_NAME:
             'PORT': WS_DB_PORT,
         }
     }
+    if WS_DB_REPLICA_HOSTS:
+        SQL_READ_REPLICAS = {
+            alias: WS_DB_REPLICA_HOSTS
+            for alias, config in DATABASES.items()
+            if alias != 'default' and config['HOST'] == WS_DB_HOST
+        }
 else:
     # Local development fallback
     DATABASES = {
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
 from exercises.views import (
@@ -5,18 +6,28 @@ from exercises.views import (
     ExerciseListView,
     ExerciseDetailView,
     ExecuteQueryView,
-    SubmitQueryView
+    SubmitQueryView,
+    ExecutionStatsView,
+    AsyncExecuteQueryView,
+    AsyncSubmitQueryView
 )
 from ai_tutor.views import ExerciseAIView
 from frontend.views import IndexView
 
+# In async mode (run under ASGI) query execution awaits MySQL instead of blocking a thread
+if settings.SQL_EXECUTION_MODE == 'async':
+    execute_view, submit_view = AsyncExecuteQueryView.as_view(), AsyncSubmitQueryView.as_view()
+else:
+    execute_view, submit_view = ExecuteQueryView.as_view(), SubmitQueryView.as_view()
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/schemas/', SchemaListView.as_view(), name='schema-list'),
     path('api/exercises/', ExerciseListView.as_view(), name='exercise-list'),
     path('api/exercises/<int:exercise_id>/', ExerciseDetailView.as_view(), name='exercise-detail'),
-    path('api/exercises/<int:exercise_id>/execute/', ExecuteQueryView.as_view(), name='execute-query'),
-    path('api/exercises/<int:exercise_id>/submit/', SubmitQueryView.as_view(), name='submit-query'),
+    path('api/exercises/<int:exercise_id>/execute/', execute_view, name='execute-query'),
+    path('api/exercises/<int:exercise_id>/submit/', submit_view, name='submit-query'),
+    path('api/stats/', ExecutionStatsView.as_view(), name='execution-stats'),
     path('api/exercises/<int:exercise_id>/ai/', ExerciseAIView.as_view(), name='exercise-ai'),
     path('', IndexView.as_view(), name='index'),
 ]
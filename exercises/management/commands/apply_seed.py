@@ -1,26 +1,68 @@
+import sqlparse
 from django.core.management.base import BaseCommand
 from django.db import connection, transaction
+from django.utils import timezone
 from exercises.models import DatabaseSchema
+from exercises.services import result_cache
+from exercises.services.catalog import invalidate_catalog
+from exercises.services.sandbox import build_snapshot, invalidate_sandboxes, SandboxUnsupported
+
+
+def run_script(cursor, script):
+    """executescript only exists on SQLite; other backends get one statement at a time"""
+    if connection.vendor == 'sqlite':
+        cursor.executescript(script)
+        return
+    for statement in sqlparse.split(script):
+        if statement.strip():
+            cursor.execute(statement)
 
 
 class Command(BaseCommand):
     help = 'Apply schema_sql and seed_sql from DatabaseSchema into the default database'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--skip-snapshots', action='store_true',
+                            help='Do not rebuild the local sandbox snapshot files')
+
     def handle(self, *args, **options):
         schemas = DatabaseSchema.objects.all()
         if not schemas:
             self.stdout.write(self.style.WARNING('No DatabaseSchema records found'))
             return
 
+        applied = []
         with connection.cursor() as cursor:
             for s in schemas:
                 self.stdout.write(f'Applying schema for {s.name}...')
                 try:
                     with transaction.atomic():
                         if s.schema_sql:
-                            cursor.executescript(s.schema_sql)
+                            run_script(cursor, s.schema_sql)
                         if s.seed_sql:
-                            cursor.executescript(s.seed_sql)
+                            run_script(cursor, s.seed_sql)
+                    # Bump updated_at so cached expected results keyed on it go stale in every worker
+                    DatabaseSchema.objects.filter(pk=s.pk).update(updated_at=timezone.now())
+                    applied.append(s.pk)
                     self.stdout.write(self.style.SUCCESS(f'Applied schema and seed for {s.name}'))
                 except Exception as e:
-                    self.stdout.write(self.style.ERROR(f'Failed to apply {s.name}: {e}'))
\ No newline at end of file
+                    self.stdout.write(self.style.ERROR(f'Failed to apply {s.name}: {e}'))
+
+        result_cache.invalidate_database()
+        result_cache.invalidate_query_results()
+        invalidate_catalog()
+        invalidate_sandboxes()
+
+        if options['skip_snapshots']:
+            return
+        # Pre-build the sandbox templates so workers only copy them
+        for s in DatabaseSchema.objects.filter(pk__in=applied):
+            if not s.schema_sql:
+                continue
+            try:
+                path = build_snapshot(s)
+            except SandboxUnsupported as e:
+                self.stdout.write(self.style.WARNING(f'No sandbox snapshot for {s.name}: {e}'))
+                continue
+            if path:
+                self.stdout.write(self.style.SUCCESS(f'Built sandbox snapshot {path}'))
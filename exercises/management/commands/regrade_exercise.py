@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from exercises.models import Exercise
+from exercises.views import regrade
+
+
+class Command(BaseCommand):
+    help = "Re-grade all submissions and progress of exercises against their current expected_sql"
+
+    def add_arguments(self, parser):
+        parser.add_argument('exercise_ids', nargs='+', type=int)
+        parser.add_argument('--revoke', action='store_true',
+                            help='Also reset completed progress whose completing query is now incorrect')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Parallel queries per exercise (default settings.REGRADE_WORKERS)')
+
+    def handle(self, *args, **options):
+        exercises = Exercise.objects.select_related('schema').filter(id__in=options['exercise_ids'])
+        missing = set(options['exercise_ids']) - {e.id for e in exercises}
+        if missing:
+            raise CommandError(f'Unknown exercise id(s): {sorted(missing)}')
+
+        for exercise in exercises:
+            result = regrade(exercise, revoke=options['revoke'], workers=options['workers'])
+            if 'error' in result:
+                self.stdout.write(self.style.ERROR(f'{exercise.title}: {result["error"]}'))
+                continue
+            self.stdout.write(self.style.SUCCESS(
+                f'{exercise.title}: {result["submissions"]} submissions, {result["progress"]} progress rows, '
+                f'{result["distinct_queries"]} distinct queries ({result["correct_queries"]} correct); '
+                f'updated {result["submissions_changed"]} submissions and {result["progress_changed"]} progress rows '
+                f'in {result["elapsed"]}s'
+            ))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exercises', '0002_submission'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exercise',
+            name='time_limit',
+            field=models.FloatField(blank=True, help_text='Per-statement time budget in seconds (default 5)', null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exercises', '0003_exercise_time_limit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exercise',
+            name='grading_options',
+            field=models.JSONField(blank=True, default=dict, help_text='{"decimal_places": 2, "ignore_case": true, "ignore_whitespace": true}'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exercises', '0004_exercise_grading_options'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='exercise',
+            index=models.Index(fields=['order', 'id'], name='exercises_order_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exercise',
+            index=models.Index(fields=['schema', 'difficulty', 'order', 'id'], name='exercises_schema_diff_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exercise',
+            index=models.Index(fields=['difficulty', 'order', 'id'], name='exercises_diff_order_idx'),
+        ),
+    ]
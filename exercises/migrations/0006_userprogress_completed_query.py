@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exercises', '0005_exercise_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprogress',
+            name='completed_query',
+            field=models.TextField(blank=True),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 
 class DatabaseSchema(models.Model):
     """Three schemas: HR, Ecommerce, School"""
@@ -34,6 +36,8 @@ class Exercise(models.Model):
     initial_query = models.TextField(blank=True, help_text="Starter code for students")
     hints = models.JSONField(default=list, help_text='[{"level": 1, "text": "hint1"}, ...]')
     tags = models.JSONField(default=list, help_text='["JOIN", "GROUP BY", "Subquery"]')
+    time_limit = models.FloatField(null=True, blank=True, help_text="Per-statement time budget in seconds (default 5)")
+    grading_options = models.JSONField(default=dict, blank=True, help_text='{"decimal_places": 2, "ignore_case": true, "ignore_whitespace": true}')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -43,6 +47,12 @@ class Exercise(models.Model):
     class Meta:
         db_table = 'exercises'
         ordering = ['order', 'id']
+        # Keyset pagination of the exercise list is by (order, id), optionally filtered
+        indexes = [
+            models.Index(fields=['order', 'id'], name='exercises_order_id_idx'),
+            models.Index(fields=['schema', 'difficulty', 'order', 'id'], name='exercises_schema_diff_idx'),
+            models.Index(fields=['difficulty', 'order', 'id'], name='exercises_diff_order_idx'),
+        ]
 
 class UserProgress(models.Model):
     """Track user progress (anonymous via session_id or authenticated via user)"""
@@ -52,6 +62,8 @@ class UserProgress(models.Model):
     completed = models.BooleanField(default=False)
     attempts = models.IntegerField(default=0)
     last_query = models.TextField(blank=True)
+    # The submitted query that completed the exercise; last_query changes on every Run
+    completed_query = models.TextField(blank=True)
     completed_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -60,6 +72,26 @@ class UserProgress(models.Model):
         db_table = 'user_progress'
         unique_together = [['session_id', 'exercise']]
 
+class Submission(models.Model):
+    """Graded submission by an authenticated user"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('correct', 'Correct'),
+        ('incorrect', 'Incorrect'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='submissions')
+    exercise = models.ForeignKey(Exercise, on_delete=models.CASCADE, related_name='submissions')
+    query = models.TextField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    execution_time = models.FloatField(null=True, blank=True, help_text="Query execution time in seconds")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'submissions'
+        ordering = ['-created_at']
+
 class ChatHistory(models.Model):
     """Store AI chat conversations"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
@@ -73,3 +105,36 @@ class ChatHistory(models.Model):
     class Meta:
         db_table = 'chat_history'
         ordering = ['-created_at']
+
+
+@receiver([post_save, post_delete], sender=Exercise)
+def invalidate_exercise_caches(sender, instance, **kwargs):
+    # expected_sql 或题目变化后，缓存的期望结果失效
+    from .services import result_cache
+    from .services.catalog import fixed_expected_sql_cache
+    from .services.listing import schema_listing, exercise_catalog
+    from .services.search import index_exercise, unindex_exercise
+    result_cache.invalidate_exercise(instance.id)
+    fixed_expected_sql_cache.delete_where(lambda key: key[0] == instance.id)
+    schema_listing.invalidate()
+    exercise_catalog.invalidate()
+    # 搜索索引按题目增量更新
+    if kwargs.get('signal') is post_delete:
+        unindex_exercise(instance.id)
+    else:
+        index_exercise(instance)
+
+
+@receiver([post_save, post_delete], sender=DatabaseSchema)
+def invalidate_schema_caches(sender, instance, **kwargs):
+    # schema / seed 变化（重新导入数据）后，清空结果缓存、表名目录和本地沙箱
+    from .services import result_cache
+    from .services.catalog import invalidate_catalog
+    from .services.sandbox import invalidate_sandboxes
+    from .services.listing import schema_listing, exercise_catalog
+    result_cache.invalidate_database()
+    result_cache.invalidate_query_results()
+    invalidate_catalog()
+    invalidate_sandboxes()
+    schema_listing.invalidate()
+    exercise_catalog.invalidate()
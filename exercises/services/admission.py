@@ -0,0 +1,227 @@
+import asyncio
+import itertools
+import math
+import threading
+import time
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional
+
+from django.conf import settings
+
+
+class AdmissionRejected(Exception):
+    """No execution slot could be granted; the caller should answer 429"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ('session', 'seq', 'granted', 'wake')
+
+    def __init__(self, session: str, seq: int, wake):
+        self.session = session
+        self.seq = seq
+        self.granted = False
+        self.wake = wake
+
+
+class _DatabaseState:
+    def __init__(self):
+        self.active = 0
+        self.waiters = []
+        self.running = Counter()   # session -> executing requests
+        self.holding = Counter()   # session -> executing + queued requests
+        self.hold_time = 0.0       # moving average of seconds a slot is held
+        self.stats = {
+            'admitted': 0,
+            'queued': 0,
+            'rejected_session': 0,
+            'rejected_queue_full': 0,
+            'rejected_timeout': 0,
+            'total_wait': 0.0,
+            'max_wait': 0.0,
+        }
+
+
+class AdmissionController:
+    """
+    Concurrency limits in front of the practice databases.
+
+    - At most `per_db` requests execute against one database alias at once.
+    - One session (student) may hold at most `per_session` of those slots,
+      counting requests still queued, so a Run spammer is turned away
+      instead of queueing behind itself. Requests with no session ('')
+      are exempt.
+    - Requests over the limit wait up to `max_wait` seconds in a queue of
+      at most `max_queue`. Freed slots go to the waiter whose session has
+      the fewest running requests, oldest first, so one busy session can't
+      starve the rest of the lab.
+    Rejections raise AdmissionRejected with a Retry-After estimate.
+    """
+
+    def __init__(self, per_db: int, per_session: int, max_queue: int, max_wait: float):
+        self.per_db = per_db
+        self.per_session = per_session
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._dbs: Dict[str, _DatabaseState] = {}
+        self._seq = itertools.count()
+
+    def _state(self, db_name: str) -> _DatabaseState:
+        state = self._dbs.get(db_name)
+        if state is None:
+            state = self._dbs[db_name] = _DatabaseState()
+        return state
+
+    def _retry_after(self, state: _DatabaseState) -> int:
+        # Time for the queue ahead to drain at the current service rate
+        estimate = (state.hold_time or 1.0) * (len(state.waiters) + 1) / self.per_db
+        return max(1, min(60, math.ceil(estimate)))
+
+    def _reject(self, state: _DatabaseState, reason: str, message: str):
+        state.stats['rejected_' + reason] += 1
+        raise AdmissionRejected(message, self._retry_after(state))
+
+    def _enter(self, db_name: str, session: str, wake):
+        """Take a slot now (returns None) or join the queue (returns the _Waiter)"""
+        with self._lock:
+            state = self._state(db_name)
+            # Requests without a session (e.g. many students behind one NAT)
+            # can't be told apart, so only the per-database limit applies
+            if session and state.holding[session] >= self.per_session:
+                self._reject(state, 'session',
+                             'Too many queries running for this session, please wait for them to finish.')
+            if state.active < self.per_db and not state.waiters:
+                state.active += 1
+                state.running[session] += 1
+                state.holding[session] += 1
+                state.stats['admitted'] += 1
+                return None
+            if len(state.waiters) >= self.max_queue:
+                self._reject(state, 'queue_full', f'Practice database "{db_name}" is busy, please try again.')
+            waiter = _Waiter(session, next(self._seq), wake)
+            state.waiters.append(waiter)
+            state.holding[session] += 1
+            state.stats['queued'] += 1
+            return waiter
+
+    def _grant(self, state: _DatabaseState):
+        # Called with the lock held
+        while state.active < self.per_db and state.waiters:
+            waiter = min(state.waiters, key=lambda w: (state.running[w.session], w.seq))
+            state.waiters.remove(waiter)
+            state.active += 1
+            state.running[waiter.session] += 1
+            state.stats['admitted'] += 1
+            waiter.granted = True
+            waiter.wake()
+
+    @staticmethod
+    def _forget(state: _DatabaseState, session: str):
+        state.holding[session] -= 1
+        if state.holding[session] <= 0:
+            del state.holding[session]
+            state.running.pop(session, None)
+
+    def _finish_wait(self, db_name: str, waiter: _Waiter, waited: float, cancelled: bool = False) -> bool:
+        """
+        Account for a finished wait. Returns whether the slot was granted;
+        a wait that timed out (rather than being cancelled) raises instead.
+        """
+        with self._lock:
+            state = self._state(db_name)
+            state.stats['total_wait'] += waited
+            state.stats['max_wait'] = max(state.stats['max_wait'], waited)
+            if waiter.granted:
+                return True
+            state.waiters.remove(waiter)
+            self._forget(state, waiter.session)
+            if cancelled:
+                return False
+            self._reject(state, 'timeout', f'Practice database "{db_name}" is busy, please try again.')
+
+    def _leave(self, db_name: str, session: str, held: Optional[float]):
+        with self._lock:
+            state = self._state(db_name)
+            state.active -= 1
+            state.running[session] -= 1
+            self._forget(state, session)
+            if held is not None:
+                state.hold_time = held if not state.hold_time else 0.8 * state.hold_time + 0.2 * held
+            self._grant(state)
+
+    @contextmanager
+    def admit(self, db_name: str, session: str):
+        """Hold an execution slot for `db_name` for the duration of the block"""
+        event = threading.Event()
+        waiter = self._enter(db_name, session, event.set)
+        if waiter is not None:
+            started = time.monotonic()
+            event.wait(self.max_wait)
+            self._finish_wait(db_name, waiter, time.monotonic() - started)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._leave(db_name, session, time.monotonic() - started)
+
+    @asynccontextmanager
+    async def aadmit(self, db_name: str, session: str):
+        """admit() for coroutines; waits on the event loop instead of a thread"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        waiter = self._enter(db_name, session, wake)
+        if waiter is not None:
+            started = time.monotonic()
+            try:
+                await asyncio.wait_for(asyncio.shield(future), self.max_wait)
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                # Give back a slot granted while we were being cancelled
+                if self._finish_wait(db_name, waiter, time.monotonic() - started, cancelled=True):
+                    self._leave(db_name, session, None)
+                raise
+            self._finish_wait(db_name, waiter, time.monotonic() - started)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._leave(db_name, session, time.monotonic() - started)
+
+    def stats(self) -> Dict[str, Dict]:
+        """Per-alias slots in use, queue depth, wait times and rejections"""
+        with self._lock:
+            data = {}
+            for db_name, state in self._dbs.items():
+                item = dict(state.stats)
+                waits = state.stats['queued'] or 1
+                item.update({
+                    'active': state.active,
+                    'queue_depth': len(state.waiters),
+                    'avg_wait': round(state.stats['total_wait'] / waits, 4),
+                    'avg_hold_time': round(state.hold_time, 4),
+                    'sessions': len(state.holding),
+                })
+                data[db_name] = item
+        return data
+
+
+def admission_enabled() -> bool:
+    return getattr(settings, 'SQL_ADMISSION_ENABLED', True)
+
+
+admission = AdmissionController(
+    per_db=getattr(settings, 'SQL_ADMISSION_PER_DB', getattr(settings, 'SQL_POOL_MAX_SIZE', 10)),
+    per_session=getattr(settings, 'SQL_ADMISSION_PER_SESSION', 2),
+    max_queue=getattr(settings, 'SQL_ADMISSION_MAX_QUEUE', 50),
+    max_wait=getattr(settings, 'SQL_ADMISSION_MAX_WAIT', 2),
+)
@@ -0,0 +1,278 @@
+import asyncio
+import time
+from contextlib import nullcontext
+from typing import Dict
+
+import aiomysql
+import pymysql
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .admission import admission, admission_enabled, AdmissionRejected
+from .comparator import column_kinds
+from .executor import SQLExecutor
+from .plan_check import explain_mode, cached_estimate, store_estimate, estimate_rows_examined, plan_verdict
+from .pool import get_host_selector, is_connection_error, PoolExhausted
+from .result_cache import get_cached_query_result, store_query_result
+from .singleflight import async_inflight_queries, single_flight_enabled
+from .validator import normalize_sql
+from .watchdog import kill_query
+
+
+# aiomysql pools are bound to the event loop that created them, so they are
+# kept per (database alias, host, loop)
+_async_pools: Dict[tuple, aiomysql.Pool] = {}
+
+
+async def get_async_pool(db_name: str, addr=None) -> aiomysql.Pool:
+    """
+    Return the aiomysql pool for a `settings.DATABASES` alias on the running loop;
+    `addr` picks one (host, port) of its read replicas (see pool.HostSelector)
+    """
+    loop = asyncio.get_running_loop()
+    key = (db_name, addr, loop)
+    pool = _async_pools.get(key)
+    if pool is not None:
+        return pool
+
+    if db_name not in settings.DATABASES:
+        raise ValueError(f"Invalid database: {db_name}")
+
+    db_config = settings.DATABASES[db_name]
+    host, port = addr or (db_config.get('HOST'), db_config.get('PORT'))
+    pool = await aiomysql.create_pool(
+        host=host,
+        user=db_config.get('USER'),
+        password=db_config.get('PASSWORD'),
+        db=db_config.get('NAME'),
+        port=int(port or 3306),
+        minsize=0,
+        maxsize=getattr(settings, 'SQL_POOL_MAX_SIZE', 10),
+        pool_recycle=getattr(settings, 'SQL_POOL_MAX_LIFETIME', 1800),
+        connect_timeout=5,
+        autocommit=True,
+    )
+
+    # Another coroutine may have created one while we were connecting
+    existing = _async_pools.setdefault(key, pool)
+    if existing is not pool:
+        pool.close()
+    return existing
+
+
+class AsyncSQLExecutor(SQLExecutor):
+    """
+    SQLExecutor variant for ASGI views.
+    `aexecute` awaits the network instead of blocking a thread and returns
+    the same result dict as `SQLExecutor.execute`.
+    """
+
+    async def _apply_time_limit_async(self, connection):
+        """Async counterpart of SQLExecutor._apply_time_limit"""
+        limit_ms = int(self.time_limit * 1000)
+        if getattr(connection, '_max_execution_time', None) == limit_ms:
+            return
+        try:
+            async with connection.cursor() as cursor:
+                await cursor.execute('SET SESSION max_execution_time = %s', (limit_ms,))
+        except pymysql.MySQLError as e:
+            if is_connection_error(e):
+                raise
+        connection._max_execution_time = limit_ms
+
+    async def _check_plan_async(self, connection, query: str):
+        """Async counterpart of SQLExecutor._check_plan"""
+        estimate = cached_estimate(self.db_name, query)
+        if estimate is None:
+            try:
+                async with connection.cursor() as cursor:
+                    await cursor.execute('EXPLAIN FORMAT=JSON ' + query)
+                    row = await cursor.fetchone()
+                estimate = estimate_rows_examined(row[0])
+            except pymysql.MySQLError as e:
+                if is_connection_error(e) or self._is_timeout_error(e):
+                    raise
+                return None
+            except (ValueError, TypeError, IndexError):
+                return None
+            store_estimate(self.db_name, query, estimate)
+        return plan_verdict(self.db_name, estimate)
+
+    def _kill_quietly(self, thread_id: int, addr=None):
+        try:
+            kill_query(self.db_name, thread_id, addr)
+        except Exception:
+            pass
+
+    async def _checkout(self, pool: aiomysql.Pool):
+        """pool.acquire() bounded like ConnectionPool's checkout; raises PoolExhausted"""
+        timeout = getattr(settings, 'SQL_POOL_CHECKOUT_TIMEOUT', 5)
+        try:
+            return await asyncio.wait_for(pool.acquire(), timeout)
+        except asyncio.TimeoutError:
+            raise PoolExhausted(f'No free connection to "{self.db_name}" within {timeout}s (max {pool.maxsize})')
+
+    async def _acquire(self):
+        """
+        Returns (pool, connection, addr). With read replicas, fails over to
+        the next host when one can't be connected to or its pool is
+        exhausted, like pool.ReplicatedPool; addr is None otherwise.
+        """
+        selector = get_host_selector(self.db_name)
+        if selector is None:
+            pool = await get_async_pool(self.db_name)
+            return pool, await self._checkout(pool), None
+        tried = []
+        last_error = None
+        while True:
+            addr = selector.pick(exclude=tried)
+            if addr is None:
+                raise last_error or PoolExhausted(f'No hosts configured for "{self.db_name}"')
+            tried.append(addr)
+            try:
+                pool = await get_async_pool(self.db_name, addr)
+                return pool, await self._checkout(pool), addr
+            except PoolExhausted as e:
+                # Saturated, not down: try the next host without marking this one
+                last_error = e
+            except pymysql.MySQLError as e:
+                selector.failure(addr)
+                last_error = e
+
+    async def _fetch(self, cursor, query: str):
+        await cursor.execute(query)
+        columns = [desc[0] for desc in cursor.description] if cursor.description else []
+        column_types = column_kinds(cursor.description)
+        rows = await cursor.fetchmany(self.MAX_ROWS)
+        truncated = len(rows) == self.MAX_ROWS and await cursor.fetchone() is not None
+        return columns, column_types, rows, truncated
+
+    async def aexecute(self, query: str, check_plan: bool = True) -> Dict:
+        is_valid, error = self.validate_query(query)
+        if not is_valid:
+            return {
+                'success': False,
+                'error': error,
+                'error_type': 'validation',
+                'columns': [],
+                'rows': [],
+                'row_count': 0,
+                'execution_time': 0
+            }
+
+        start_time = time.time()
+
+        cache_key = self._cache_key(query, check_plan)
+        if cache_key:
+            cached = get_cached_query_result(self.db_name, cache_key)
+            if cached is not None:
+                cached['execution_time'] = round(time.time() - start_time, 3)
+                return cached
+
+        flight_key = normalize_sql(query) if single_flight_enabled() else ''
+        if flight_key:
+            result, shared = await async_inflight_queries.do((self.db_name, check_plan, self.time_limit, flight_key),
+                                                             lambda: self._arun(query, check_plan, start_time))
+            if shared:
+                result = dict(result, shared=True)
+                if result.get('error_type') == 'throttled':
+                    result = await self._arun(query, check_plan, start_time)
+        else:
+            result = await self._arun(query, check_plan, start_time)
+
+        if cache_key and not result.get('shared'):
+            store_query_result(self.db_name, cache_key, result)
+        return result
+
+    async def _arun(self, query: str, check_plan: bool, start_time: float) -> Dict:
+        config_error = self._config_error()
+        if config_error:
+            return self._failure(config_error, start_time)
+
+        try:
+            async with self._aadmission():
+                return await self._arun_admitted(query, check_plan, start_time)
+        except AdmissionRejected as e:
+            return self._throttled(e, start_time)
+
+    def _aadmission(self):
+        if self.client is None or not admission_enabled():
+            return nullcontext()
+        return admission.aadmit(self.db_name, self.client)
+
+    async def _arun_admitted(self, query: str, check_plan: bool, start_time: float) -> Dict:
+        try:
+            pool, connection, addr = await self._acquire()
+            selector = get_host_selector(self.db_name) if addr else None
+            if selector:
+                selector.begin(addr)
+            started = time.monotonic()
+            failed = False
+            try:
+                await self._apply_time_limit_async(connection)
+                warning = None
+                mode = explain_mode()
+                if check_plan and mode != 'off':
+                    warning = await asyncio.wait_for(
+                        self._check_plan_async(connection, query), self.time_limit + self.KILL_GRACE
+                    )
+                    if warning and mode == 'reject':
+                        return self._failure(warning, start_time, 'too_expensive')
+                # Unbuffered cursor, as in SQLExecutor.execute. aiomysql has
+                # no read_timeout, so the deadline covers execute and fetch;
+                # max_execution_time normally stops the statement first.
+                cursor = await connection.cursor(aiomysql.SSCursor)
+                columns, column_types, rows, truncated = await asyncio.wait_for(
+                    self._fetch(cursor, query), self.time_limit + self.KILL_GRACE
+                )
+                if truncated:
+                    # Drop the connection rather than drain the rest of the result
+                    connection.close()
+                else:
+                    await cursor.close()
+            except asyncio.TimeoutError:
+                # Stop the statement server-side too, then drop the connection
+                await sync_to_async(self._kill_quietly)(connection.thread_id(), addr)
+                connection.close()
+                raise
+            except asyncio.CancelledError:
+                # The connection is mid-result; make sure the pool drops it
+                connection.close()
+                raise
+            except pymysql.MySQLError as e:
+                if is_connection_error(e):
+                    failed = True
+                    connection.close()
+                raise
+            finally:
+                if selector:
+                    selector.end(addr, time.monotonic() - started, failed=failed)
+                await pool.release(connection)
+
+            result = {
+                'success': True,
+                'columns': columns,
+                'rows': list(rows),
+                'row_count': len(rows),
+                'truncated': truncated,
+                'column_types': column_types,
+                'execution_time': round(time.time() - start_time, 3),
+                'error': None
+            }
+            result['fingerprint'] = self._fingerprint(result)
+            if warning:
+                result['warning'] = warning
+            return result
+
+        except PoolExhausted as e:
+            return self._failure(f'Practice database "{self.db_name}" is busy, please try again. ({e})', start_time, 'busy')
+
+        except asyncio.TimeoutError:
+            return self._timeout_failure(start_time)
+
+        except pymysql.MySQLError as e:
+            if self._is_timeout_error(e):
+                return self._timeout_failure(start_time)
+            # May probe for alternative databases, which is blocking I/O
+            message = await sync_to_async(self._mysql_error_message)(e)
+            return self._failure(message, start_time)
@@ -0,0 +1,85 @@
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from .pool import get_pool
+from .result_cache import TTLCache
+
+
+class SchemaCatalog:
+    """Snapshot of the tables, columns and column types of one practice database"""
+
+    def __init__(self, db_name: str, columns: Dict[str, List[Tuple[str, str]]]):
+        self.db_name = db_name
+        # Actual table name -> [(column name, data type), ...] in ordinal order
+        self.columns = columns
+        # Lower-cased table name -> actual table name, for case fixing
+        self.tables = {name.lower(): name for name in columns}
+        self.loaded_at = time.monotonic()
+
+    @property
+    def version(self) -> float:
+        return self.loaded_at
+
+
+# expected_sql with table names fixed against a catalog, keyed by
+# (exercise id, sha1 of expected_sql, db alias, catalog version)
+fixed_expected_sql_cache = TTLCache(max_entries=1024, ttl=getattr(settings, 'SCHEMA_CATALOG_TTL', 600))
+
+_catalogs: Dict[str, SchemaCatalog] = {}
+_catalogs_lock = threading.Lock()
+_load_locks: Dict[str, threading.Lock] = {}
+
+
+def _load_catalog(db_name: str) -> SchemaCatalog:
+    columns: Dict[str, List[Tuple[str, str]]] = {}
+    with get_pool(db_name).connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE "
+                "FROM information_schema.COLUMNS "
+                "WHERE TABLE_SCHEMA = DATABASE() "
+                "ORDER BY TABLE_NAME, ORDINAL_POSITION"
+            )
+            for table, column, data_type in cursor.fetchall():
+                columns.setdefault(table, []).append((column, data_type))
+    return SchemaCatalog(db_name, columns)
+
+
+def get_catalog(db_name: str, refresh: bool = False) -> Optional[SchemaCatalog]:
+    """
+    Return the cached catalog for a database alias, loading it on first use
+    or once it is older than SCHEMA_CATALOG_TTL seconds.
+    Returns None if the database cannot be reached.
+    """
+    ttl = getattr(settings, 'SCHEMA_CATALOG_TTL', 600)
+    catalog = _catalogs.get(db_name)
+    if not refresh and catalog is not None and time.monotonic() - catalog.loaded_at < ttl:
+        return catalog
+
+    with _catalogs_lock:
+        load_lock = _load_locks.setdefault(db_name, threading.Lock())
+
+    # Only one thread per alias reloads; the others reuse its result
+    with load_lock:
+        current = _catalogs.get(db_name)
+        if current is not None and current is not catalog and not refresh:
+            return current
+        try:
+            catalog = _load_catalog(db_name)
+        except Exception:
+            # Keep serving a stale catalog rather than none at all
+            return current
+        _catalogs[db_name] = catalog
+        return catalog
+
+
+def invalidate_catalog(db_name: Optional[str] = None):
+    """Drop the cached catalog for one alias (or all); the next use reloads it"""
+    with _catalogs_lock:
+        if db_name is None:
+            _catalogs.clear()
+        else:
+            _catalogs.pop(db_name, None)
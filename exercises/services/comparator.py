@@ -0,0 +1,436 @@
+import datetime
+import hashlib
+import re
+import struct
+from collections import Counter
+from decimal import Decimal
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import sqlparse
+from django.conf import settings
+from pymysql.constants import FIELD_TYPE
+from sqlparse import tokens as T
+
+
+_MASK = (1 << 64) - 1
+
+# Column kinds used to pick a value normalizer, resolved once per column
+# from cursor.description (or from the first non-NULL value if unknown)
+_FIELD_KINDS = {
+    FIELD_TYPE.TINY: 'integer', FIELD_TYPE.SHORT: 'integer', FIELD_TYPE.LONG: 'integer',
+    FIELD_TYPE.LONGLONG: 'integer', FIELD_TYPE.INT24: 'integer', FIELD_TYPE.YEAR: 'integer',
+    FIELD_TYPE.DECIMAL: 'number', FIELD_TYPE.NEWDECIMAL: 'number',
+    FIELD_TYPE.FLOAT: 'number', FIELD_TYPE.DOUBLE: 'number',
+    FIELD_TYPE.DATE: 'date', FIELD_TYPE.NEWDATE: 'date',
+    FIELD_TYPE.DATETIME: 'datetime', FIELD_TYPE.TIMESTAMP: 'datetime',
+    FIELD_TYPE.TIME: 'time',
+    FIELD_TYPE.VARCHAR: 'text', FIELD_TYPE.VAR_STRING: 'text', FIELD_TYPE.STRING: 'text',
+    FIELD_TYPE.ENUM: 'text', FIELD_TYPE.SET: 'text', FIELD_TYPE.JSON: 'text',
+    FIELD_TYPE.TINY_BLOB: 'text', FIELD_TYPE.MEDIUM_BLOB: 'text',
+    FIELD_TYPE.LONG_BLOB: 'text', FIELD_TYPE.BLOB: 'text',
+}
+
+
+@lru_cache(maxsize=1024)
+def order_by_terms(sql: str) -> Optional[Tuple[str, ...]]:
+    """
+    Sort keys of the outermost query's ORDER BY, without ASC/DESC
+    (e.g. ('d.name', 'COUNT(*)')), or None if it has no ORDER BY.
+    ORDER BY inside subqueries, CTEs or window functions
+    (OVER (ORDER BY ...)) doesn't count.
+    """
+    statements = sqlparse.parse(sql or '')
+    if not statements:
+        return None
+    depth = 0
+    terms = None
+    for tok in statements[0].flatten():
+        if tok.ttype in T.Punctuation:
+            if tok.value == '(':
+                depth += 1
+            elif tok.value == ')':
+                depth -= 1
+            elif depth == 0 and terms is not None:
+                if tok.value == ';':
+                    break
+                if tok.value == ',':
+                    terms.append([])
+                    continue
+        if tok.is_whitespace or tok.ttype in T.Comment:
+            if terms is not None and terms[-1]:
+                terms[-1].append(' ')
+            continue
+        if depth == 0 and tok.ttype in T.Keyword:
+            keyword = ' '.join(tok.normalized.split())
+            if keyword == 'ORDER BY':
+                terms = [[]]
+                continue
+            if terms is not None and keyword in ('LIMIT', 'OFFSET', 'FOR', 'LOCK'):
+                break
+            if terms is not None and keyword in ('ASC', 'DESC'):
+                continue
+        if terms is not None:
+            terms[-1].append(tok.value)
+    if terms is None:
+        return None
+    return tuple(' '.join(''.join(parts).split()) for parts in terms)
+
+
+def has_order_by(sql: str) -> bool:
+    """
+    True if the outermost query has an ORDER BY, i.e. row order is part of
+    the expected answer (see order_by_terms).
+    """
+    return order_by_terms(sql) is not None
+
+
+_QUALIFIED_NAME = re.compile(r'^[`"]?\w+[`"]?(\.[`"]?\w+[`"]?)*$')
+
+
+def order_key_columns(terms: Sequence[str], columns: Sequence[str]) -> Optional[List[int]]:
+    """
+    Result column index of each ORDER BY term: a position (ORDER BY 2), an
+    alias or column name (a table qualifier is ignored), or an expression
+    that is itself a result column (MySQL names those by their text).
+    None if any term doesn't resolve to a result column.
+    """
+    names = [' '.join(c.split()).lower() for c in columns]
+    compact = [''.join(c.split()).lower() for c in columns]
+    indexes = []
+    for term in terms:
+        if term.isdigit():
+            if not 1 <= int(term) <= len(columns):
+                return None
+            indexes.append(int(term) - 1)
+            continue
+        name = term.lower()
+        if _QUALIFIED_NAME.match(term):
+            name = term.split('.')[-1].strip('`"').lower()
+        if name in names:
+            indexes.append(names.index(name))
+        elif ''.join(term.split()).lower() in compact:
+            indexes.append(compact.index(''.join(term.split()).lower()))
+        else:
+            return None
+    return indexes
+
+
+def align_columns(user_columns: Sequence[str], expected_columns: Sequence[str]) -> Optional[List[int]]:
+    """
+    For each expected column, the index of the user column with the same
+    name (case-insensitive). Repeated names are matched in order.
+    Returns None if the names don't match up one to one.
+    """
+    if len(user_columns) != len(expected_columns):
+        return None
+    positions = {}
+    for i, name in enumerate(user_columns):
+        positions.setdefault(name.lower(), []).append(i)
+    mapping = []
+    for name in expected_columns:
+        candidates = positions.get(name.lower())
+        if not candidates:
+            return None
+        mapping.append(candidates.pop(0))
+    return mapping
+
+
+def row_projector(mapping: List[int]) -> Callable[[Sequence], tuple]:
+    """Function turning a user row into a tuple in expected column order"""
+    if mapping == list(range(len(mapping))):
+        return tuple
+    return lambda row: tuple([row[i] for i in mapping])
+
+
+def grading_options(overrides: Optional[Dict] = None) -> Dict:
+    """
+    Value normalization options: settings defaults updated with per-exercise
+    overrides (Exercise.grading_options).
+      - decimal_places: DECIMAL/FLOAT values are compared rounded to this many places
+      - ignore_case: compare strings case-insensitively
+      - ignore_whitespace: trim strings and collapse inner whitespace
+    """
+    options = {
+        'decimal_places': getattr(settings, 'GRADING_DECIMAL_PLACES', 6),
+        'ignore_case': False,
+        'ignore_whitespace': False,
+    }
+    if overrides:
+        options.update((k, v) for k, v in overrides.items() if k in options)
+    return options
+
+
+def column_kinds(description) -> List[Optional[str]]:
+    """Kind of each column from a DB-API cursor.description (None if unknown)"""
+    if not description:
+        return []
+    return [_FIELD_KINDS.get(desc[1]) for desc in description]
+
+
+def _value_kind(value) -> str:
+    if isinstance(value, int):
+        return 'integer'
+    if isinstance(value, (float, Decimal)):
+        return 'number'
+    if isinstance(value, datetime.datetime):
+        return 'datetime'
+    if isinstance(value, datetime.date):
+        return 'date'
+    if isinstance(value, (datetime.time, datetime.timedelta)):
+        return 'time'
+    if isinstance(value, str):
+        return 'text'
+    return 'other'
+
+
+def result_kinds(result: Dict) -> List[str]:
+    """
+    Column kinds of an executor result: its 'column_types', with unknown
+    columns (e.g. from the SQLite fallback) inferred from the first
+    non-NULL value.
+    """
+    n = len(result['columns'])
+    kinds = list(result.get('column_types') or [None] * n)
+    for i in range(n):
+        if kinds[i] is None:
+            value = next((row[i] for row in result['rows'] if row[i] is not None), None)
+            kinds[i] = _value_kind(value) if value is not None else 'other'
+    return kinds
+
+
+def _time_text(value) -> str:
+    # MySQL TIME arrives as a timedelta and may exceed 24h or be negative
+    if isinstance(value, datetime.timedelta):
+        micros = value // datetime.timedelta(microseconds=1)
+        sign = '-' if micros < 0 else ''
+        seconds, micros = divmod(abs(micros), 1_000_000)
+        minutes, seconds = divmod(seconds, 60)
+        hours, minutes = divmod(minutes, 60)
+        text = f'{sign}{hours:02d}:{minutes:02d}:{seconds:02d}'
+        return f'{text}.{micros:06d}' if micros else text
+    if isinstance(value, datetime.time):
+        return value.isoformat()
+    return value
+
+
+def value_normalizer(kind: str, options: Dict) -> Optional[Callable]:
+    """
+    Normalizer for one column kind, or None when values compare as they are.
+    NULL stays None, so it never equals the string 'None'.
+    """
+    if kind == 'number':
+        places = options['decimal_places']
+
+        def normalize(v):
+            # Decimal('3.50') == 3.5; integers stay exact
+            if v is None or isinstance(v, int):
+                return v
+            try:
+                return round(float(v), places)
+            except (TypeError, ValueError):
+                return v
+        return normalize
+    if kind == 'date':
+        return lambda v: v.isoformat() if isinstance(v, datetime.date) else v
+    if kind == 'datetime':
+        return lambda v: v.isoformat(sep=' ') if isinstance(v, datetime.datetime) else v
+    if kind == 'time':
+        return _time_text
+    if kind == 'text' and (options['ignore_case'] or options['ignore_whitespace']):
+        ignore_case, ignore_whitespace = options['ignore_case'], options['ignore_whitespace']
+
+        def normalize(v):
+            if not isinstance(v, str):
+                return v
+            if ignore_whitespace:
+                v = ' '.join(v.split())
+            return v.casefold() if ignore_case else v
+        return normalize
+    return None
+
+
+def normalizing_projector(mapping: List[int], kinds: Sequence[str], options: Dict) -> Callable[[Sequence], tuple]:
+    """
+    Like row_projector, but also normalizes each value for its column kind
+    (`kinds` is indexed by source column). Falls back to the plain
+    projector when no column needs normalizing.
+    """
+    normalizers = [value_normalizer(kinds[i], options) for i in mapping]
+    if not any(normalizers):
+        return row_projector(mapping)
+    pairs = list(zip(mapping, normalizers))
+    return lambda row: tuple([row[i] if f is None else f(row[i]) for i, f in pairs])
+
+
+def canonical_order(columns: Sequence[str]) -> List[int]:
+    """Column indexes sorted by lower-cased name, repeated names kept in order"""
+    return sorted(range(len(columns)), key=lambda i: columns[i].lower())
+
+
+def _canonical_value(value) -> bytes:
+    """
+    Type-tagged bytes for a normalized value. Values that compare equal
+    across types (1 == 1.0 == True) encode the same, as they match in
+    first_mismatch.
+    """
+    if value is None:
+        return b'N'
+    if isinstance(value, int):
+        return b'i%d' % value
+    if isinstance(value, float):
+        return b'i%d' % value if value.is_integer() else b'f' + repr(value).encode()
+    if isinstance(value, Decimal):
+        if value.is_finite() and value == value.to_integral_value():
+            return b'i%d' % int(value)
+        return b'd' + str(value.normalize()).encode()
+    if isinstance(value, str):
+        return b's' + value.encode('utf-8', 'surrogatepass')
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return b'b' + bytes(value)
+    return b'r' + repr(value).encode('utf-8', 'backslashreplace')
+
+
+def _row_digest(row: tuple) -> int:
+    digest = hashlib.blake2b(digest_size=8)
+    for value in row:
+        data = _canonical_value(value)
+        # Length-prefixed, so ('ab', 'c') and ('a', 'bc') differ
+        digest.update(struct.pack('<I', len(data)))
+        digest.update(data)
+    return int.from_bytes(digest.digest(), 'little')
+
+
+def result_fingerprint(columns: Sequence[str], rows: Sequence, kinds: Sequence[str]) -> Tuple[int, int, int]:
+    """
+    Order-independent digest of a result: (row count, sum of row digests,
+    xor of row digests), each row a BLAKE2b digest of its values in
+    canonical_order so the column order of the SELECT list doesn't matter
+    either. Values are normalized with the default grading_options().
+    Equal multisets of rows give equal fingerprints; different ones
+    collide with negligible probability, so compare_results treats a
+    match as equality. Fingerprints are stable across processes.
+    """
+    project = normalizing_projector(canonical_order(columns), kinds, grading_options())
+    digests = [_row_digest(project(row)) for row in rows]
+    mixed = 0
+    for h in digests:
+        mixed ^= h
+    return len(digests), sum(digests) & _MASK, mixed
+
+
+def first_mismatch(user_rows: Sequence, expected_rows: Sequence, project_user: Callable[[Sequence], tuple],
+                   project_expected: Callable[[Sequence], tuple], ordered: bool,
+                   order_keys: Optional[Sequence[int]] = None) -> Optional[int]:
+    """
+    Index of the first user row that has no match in the expected rows,
+    or None if both hold the same rows (as a multiset, or in the same order
+    when `ordered`). Linear time; stops at the first difference.
+    `order_keys` are the (projected) column indexes the expected result is
+    sorted by (see order_key_columns): rows tied on them may come in any
+    order, as the database is free to return them so. Without them an
+    ordered compare is position by position.
+    Callers compare row counts first.
+    """
+    if ordered and order_keys is None:
+        for i, (user_row, expected_row) in enumerate(zip(user_rows, expected_rows)):
+            if project_user(user_row) != project_expected(expected_row):
+                return i
+        return None
+
+    if ordered:
+        # Each run of expected rows with equal sort keys must be matched,
+        # as a multiset, by the user rows at the same positions
+        start = 0
+        expected = list(map(project_expected, expected_rows))
+        while start < len(expected):
+            run_key = tuple(expected[start][k] for k in order_keys)
+            end = start + 1
+            while end < len(expected) and tuple(expected[end][k] for k in order_keys) == run_key:
+                end += 1
+            remaining = Counter(expected[start:end])
+            for i in range(start, end):
+                key = project_user(user_rows[i])
+                count = remaining.get(key, 0)
+                if count == 0:
+                    return i
+                remaining[key] = count - 1
+            start = end
+        return None
+
+    remaining = Counter(map(project_expected, expected_rows))
+    for i, user_row in enumerate(user_rows):
+        key = project_user(user_row)
+        count = remaining.get(key, 0)
+        if count == 0:
+            return i
+        remaining[key] = count - 1
+    return None
+
+
+def _cell_diffs(user_row: tuple, expected_row: tuple, columns: Sequence[str], row_index, limit: int) -> List[dict]:
+    cells = []
+    for name, actual, expected in zip(columns, user_row, expected_row):
+        if actual != expected:
+            cells.append({'row': row_index, 'column': name, 'expected': expected, 'actual': actual})
+            if len(cells) >= limit:
+                break
+    return cells
+
+
+def row_diff(user_rows: Sequence, expected_rows: Sequence, project_user: Callable[[Sequence], tuple],
+             project_expected: Callable[[Sequence], tuple], columns: Sequence[str],
+             ordered: bool = False, max_rows: int = 10, max_cells: int = 10) -> dict:
+    """
+    Structured difference between two results, in expected column order,
+    with values as normalized by the projectors.
+    Returns: {
+        'missing_rows': expected rows the user result lacks (at most max_rows),
+        'extra_rows': user rows not in the expected result (at most max_rows),
+        'missing_count': int, 'extra_count': int,
+        'cell_diffs': [{'row', 'column', 'expected', 'actual'}] (at most max_cells;
+            'row' is the position for ordered results, otherwise None)
+    }
+    Rows are matched with one hash table over the expected rows. Cell diffs
+    compare rows position by position when `ordered`; otherwise each missing
+    row is paired with an extra row that has the same first column value
+    (usually the key), so a wrong value shows up as a cell rather than as
+    one missing and one extra row.
+    """
+    remaining = Counter(map(project_expected, expected_rows))
+    extra = []
+    for row in user_rows:
+        key = project_user(row)
+        count = remaining.get(key, 0)
+        if count:
+            remaining[key] = count - 1
+        else:
+            extra.append(key)
+    missing = list(remaining.elements())
+
+    cells = []
+    if ordered:
+        for i, (user_row, expected_row) in enumerate(zip(user_rows, expected_rows)):
+            if len(cells) >= max_cells:
+                break
+            user_row, expected_row = project_user(user_row), project_expected(expected_row)
+            if user_row != expected_row:
+                cells.extend(_cell_diffs(user_row, expected_row, columns, i, max_cells - len(cells)))
+    elif columns:
+        by_first = {}
+        for row in extra:
+            by_first.setdefault(row[0], []).append(row)
+        for row in missing:
+            if len(cells) >= max_cells:
+                break
+            candidates = by_first.get(row[0])
+            if candidates:
+                cells.extend(_cell_diffs(candidates.pop(0), row, columns, None, max_cells - len(cells)))
+
+    return {
+        'missing_rows': [list(r) for r in missing[:max_rows]],
+        'extra_rows': [list(r) for r in extra[:max_rows]],
+        'missing_count': len(missing),
+        'extra_count': len(extra),
+        'cell_diffs': cells,
+    }
@@ -0,0 +1,241 @@
+import base64
+import bisect
+import gzip
+import hashlib
+import json
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from rest_framework.utils.encoders import JSONEncoder as DRFJSONEncoder
+
+
+class _Snapshot:
+    __slots__ = ('version', 'expires', 'data', 'etag')
+
+    def __init__(self, version: int, expires: float, data, etag: str):
+        self.version = version
+        self.expires = expires
+        self.data = data
+        self.etag = etag
+
+
+def payload_etag(data) -> str:
+    """Strong ETag from the serialized content, so every worker serving the same data agrees"""
+    body = json.dumps(data, cls=DRFJSONEncoder, sort_keys=True, ensure_ascii=False)
+    return body_etag(body.encode('utf-8'))
+
+
+def body_etag(body: bytes) -> str:
+    return '"%s"' % hashlib.sha1(body).hexdigest()
+
+
+def render_json(data) -> bytes:
+    """Same bytes DRF's JSONRenderer produces for `data`"""
+    body = json.dumps(data, cls=DRFJSONEncoder, ensure_ascii=False, separators=(',', ':'))
+    return body.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode('utf-8')
+
+
+class CachedListing:
+    """
+    A list endpoint's payload, built once and served from memory.
+
+    `invalidate()` (called from model signals) bumps the version and drops
+    the snapshot; a build that raced with an invalidation is served but not
+    kept. Signals only reach the worker that saved the row, so snapshots
+    also expire after `ttl` seconds to pick up changes made elsewhere.
+    """
+
+    def __init__(self, build: Callable, ttl: Optional[float] = None, etag: Callable = payload_etag):
+        self._build = build
+        self._etag = etag
+        self.ttl = ttl
+        self.version = 0
+        self._snapshot: Optional[_Snapshot] = None
+        self._lock = threading.Lock()
+
+    def _ttl(self) -> float:
+        return self.ttl if self.ttl is not None else getattr(settings, 'API_LIST_CACHE_TTL', 60)
+
+    def get(self) -> Tuple[object, str]:
+        """Returns (data, etag), building the snapshot if needed"""
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.expires > time.monotonic():
+            return snapshot.data, snapshot.etag
+        # One build at a time; the others wait for it instead of all querying
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot.expires > time.monotonic():
+                return snapshot.data, snapshot.etag
+            version = self.version
+            data = self._build()
+            snapshot = _Snapshot(version, time.monotonic() + self._ttl(), data, self._etag(data))
+            if version == self.version:
+                self._snapshot = snapshot
+        return snapshot.data, snapshot.etag
+
+    def invalidate(self):
+        self.version += 1
+        self._snapshot = None
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 requires for it)"""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+def _build_schema_list():
+    from django.db.models import Count
+    from ..models import DatabaseSchema
+
+    # One query: the count is annotated, and schema_sql / seed_sql are never loaded
+    return list(
+        DatabaseSchema.objects.order_by('id')
+        .annotate(exercise_count=Count('exercises'))
+        .values('id', 'name', 'display_name', 'description', 'exercise_count')
+    )
+
+
+schema_listing = CachedListing(_build_schema_list)
+
+
+class Representation:
+    """A pre-serialized response body with its gzip variant and their ETags"""
+
+    __slots__ = ('body', 'etag', 'gzip_body', 'gzip_etag')
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = body_etag(body)
+        # mtime=0 keeps the compressed bytes identical across workers
+        self.gzip_body = gzip.compress(body, compresslevel=6, mtime=0)
+        self.gzip_etag = self.etag[:-1] + '-gzip"'
+
+
+class ExerciseCatalog:
+    """
+    Snapshot of every exercise as ExerciseListView returns it, in
+    (order, id) order, with positions indexed by schema id and difficulty
+    so filtering never goes back to the database. Bodies for each filter
+    combination are serialized and gzipped once, on first request.
+    """
+
+    FIELDS = ('id', 'title', 'difficulty', 'order', 'schema', 'tags', 'completed')
+
+    def __init__(self, entries: List[Dict]):
+        self.entries = entries
+        self.position = {entry['id']: pos for pos, entry in enumerate(entries)}
+        self.keys = [(entry['order'], entry['id']) for entry in entries]
+        self.by_schema: Dict[str, List[int]] = {}
+        self.by_difficulty: Dict[str, List[int]] = {}
+        for pos, entry in enumerate(entries):
+            self.by_schema.setdefault(str(entry['schema']['id']), []).append(pos)
+            self.by_difficulty.setdefault(entry['difficulty'], []).append(pos)
+        self._representations: Dict[Tuple, Representation] = {}
+        self._lock = threading.Lock()
+        self.full = self.representation()
+
+    def select(self, schema_id: str = None, difficulty: str = None, ids: List[int] = None) -> List[int]:
+        """
+        Positions of the matching entries, in list order; restricted to
+        `ids` and in their order when given (ranked search results)
+        """
+        positions = None
+        for index, value in ((self.by_schema, schema_id), (self.by_difficulty, difficulty)):
+            if value:
+                matched = index.get(value, [])
+                positions = matched if positions is None else sorted(set(positions).intersection(matched))
+        if positions is None:
+            positions = range(len(self.entries))
+        if ids is not None:
+            allowed = set(positions)
+            # Ids saved after this snapshot was built are skipped until it is rebuilt
+            return [self.position[i] for i in ids if self.position.get(i) in allowed]
+        return list(positions)
+
+    def page(self, positions: List[int], after: Tuple[int, int] = None, limit: int = None):
+        """
+        Keyset page of `positions` (in list order): up to `limit` entries
+        whose (order, id) comes after `after`. Returns (positions, next key or None).
+        """
+        start = 0
+        if after is not None:
+            start = bisect.bisect_right(positions, after, key=lambda p: self.keys[p])
+        end = len(positions) if limit is None else start + limit
+        page = positions[start:end]
+        next_key = self.keys[page[-1]] if page and end < len(positions) else None
+        return page, next_key
+
+    def representation(self, schema_id: str = None, difficulty: str = None) -> Representation:
+        key = (schema_id or None, difficulty or None)
+        rep = self._representations.get(key)
+        if rep is not None:
+            return rep
+        rep = Representation(render_json([self.entries[p] for p in self.select(*key)]))
+        # Only combinations that exist are kept, so arbitrary query strings can't grow the cache
+        if (key[0] is None or key[0] in self.by_schema) and (key[1] is None or key[1] in self.by_difficulty):
+            with self._lock:
+                rep = self._representations.setdefault(key, rep)
+        return rep
+
+
+def parse_fields(value: str) -> Optional[Tuple[str, ...]]:
+    """`fields=title,difficulty` -> field names to serialize ('id' is always kept)"""
+    if not value:
+        return None
+    fields = [f.strip() for f in value.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in ExerciseCatalog.FIELDS]
+    if unknown:
+        raise ValueError(f'Unknown field(s): {", ".join(unknown)}. Available: {", ".join(ExerciseCatalog.FIELDS)}')
+    return tuple(dict.fromkeys(['id'] + fields))
+
+
+def encode_cursor(key: Tuple[int, int]) -> str:
+    return base64.urlsafe_b64encode(f'{key[0]}:{key[1]}'.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    try:
+        text = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        order, _, pk = text.partition(':')
+        return int(order), int(pk)
+    except ValueError:
+        raise ValueError('Invalid cursor')
+
+
+def _build_exercise_catalog() -> ExerciseCatalog:
+    from ..models import Exercise
+
+    entries = []
+    exercises = (Exercise.objects.select_related('schema').order_by('order', 'id')
+                 .only('id', 'title', 'difficulty', 'order', 'tags',
+                       'schema__id', 'schema__name', 'schema__display_name'))
+    for ex in exercises:
+        entries.append({
+            'id': ex.id,
+            'title': ex.title,
+            'difficulty': ex.difficulty,
+            'order': ex.order,  # 包含 order 字段，用于前端排序
+            'schema': {
+                'id': ex.schema.id,
+                'name': ex.schema.name,
+                'display_name': ex.schema.display_name,
+            },
+            'tags': ex.tags,
+            'completed': False  # per session, merged in by ExerciseListView
+        })
+    return ExerciseCatalog(entries)
+
+
+exercise_catalog = CachedListing(_build_exercise_catalog, etag=lambda catalog: catalog.full.etag)
@@ -0,0 +1,87 @@
+import json
+from typing import Optional
+
+from django.conf import settings
+
+from .result_cache import TTLCache
+from .validator import normalize_sql
+
+
+# Estimated rows examined per (db alias, normalized query text)
+plan_estimates = TTLCache(max_entries=4096, ttl=getattr(settings, 'SQL_EXPLAIN_CACHE_TTL', 600))
+
+
+def explain_mode() -> str:
+    """'off', 'warn' or 'reject' (settings.SQL_EXPLAIN_MODE)"""
+    return getattr(settings, 'SQL_EXPLAIN_MODE', 'off')
+
+
+def rows_threshold(db_name: str) -> int:
+    """Largest acceptable estimate for a database alias, falling back to 'default'"""
+    thresholds = getattr(settings, 'SQL_EXPLAIN_MAX_ROWS', {})
+    return thresholds.get(db_name, thresholds.get('default', 5_000_000))
+
+
+def _table_rows(table: dict, prefix_rows: float) -> float:
+    scan = float(table.get('rows_examined_per_scan', 0) or 0)
+    join_buffer = str(table.get('using_join_buffer', '')).lower()
+    if 'hash' in join_buffer:
+        # Hash join reads the table once, then emits the joined rows
+        examined = scan + float(table.get('rows_produced_per_join', 0) or 0)
+    else:
+        # Nested loop: one scan per row coming from the tables before it
+        examined = prefix_rows * scan
+    # Derived tables and subqueries attached to this table
+    return examined + sum(_walk(v) for k, v in table.items() if isinstance(v, (dict, list)))
+
+
+def _walk(node) -> float:
+    if isinstance(node, list):
+        return sum(_walk(item) for item in node)
+    if not isinstance(node, dict):
+        return 0.0
+
+    total = 0.0
+    for key, value in node.items():
+        if key == 'nested_loop':
+            prefix = 1.0
+            for item in value:
+                table = item.get('table', {})
+                total += _table_rows(table, prefix)
+                prefix = float(table.get('rows_produced_per_join', prefix) or prefix)
+        elif key == 'table':
+            total += _table_rows(value, 1.0)
+        elif isinstance(value, (dict, list)):
+            total += _walk(value)
+    return total
+
+
+def estimate_rows_examined(plan_json: str) -> float:
+    """
+    Rough number of rows MySQL expects to read for an EXPLAIN FORMAT=JSON plan.
+    Nested-loop joins multiply the rows produced so far by each table's
+    rows per scan, so cartesian products and unindexed self-joins stand out.
+    """
+    return _walk(json.loads(plan_json))
+
+
+def cached_estimate(db_name: str, query: str) -> Optional[float]:
+    return plan_estimates.get((db_name, normalize_sql(query)))
+
+
+def store_estimate(db_name: str, query: str, estimate: float):
+    plan_estimates.set((db_name, normalize_sql(query)), estimate)
+
+
+def plan_verdict(db_name: str, estimate: Optional[float]) -> Optional[str]:
+    """Message for a plan over the threshold, or None if it is acceptable"""
+    if estimate is None:
+        return None
+    threshold = rows_threshold(db_name)
+    if estimate <= threshold:
+        return None
+    return (
+        f'This query is estimated to examine about {int(estimate):,} rows '
+        f'(limit {threshold:,}). Check your JOIN conditions for a missing ON clause '
+        f'or an accidental cross join.'
+    )
@@ -0,0 +1,505 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import pymysql
+from django.conf import settings
+
+
+class PoolExhausted(Exception):
+    """Raised when no connection could be checked out before the timeout"""
+
+
+def is_connection_error(e: Exception) -> bool:
+    """
+    True if `e` means the connection itself is unusable.
+    pymysql raises OperationalError both for client-side failures (CR_*
+    codes 2000-2999: lost connection, timeouts) and for many ordinary server
+    errors such as 1054 unknown column, which leave the connection healthy.
+    """
+    if isinstance(e, pymysql.err.InterfaceError):
+        return True
+    if isinstance(e, pymysql.err.OperationalError):
+        code = e.args[0] if e.args else None
+        return not isinstance(code, int) or 2000 <= code < 3000
+    return False
+
+
+class _PooledConnection:
+    """A raw pymysql connection plus the bookkeeping the pool needs"""
+
+    __slots__ = ('raw', 'created_at', 'last_used')
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of pymysql connections for one practice database.
+
+    - At most `max_size` connections exist at once (idle + checked out);
+      callers block up to `checkout_timeout` seconds for a free slot.
+    - Idle connections older than `max_idle_time` and any connection older
+      than `max_lifetime` are closed instead of being handed out again;
+      the least recently used ones are swept on every checkout and return.
+    - A connection that sat idle longer than `health_check_interval` is
+      pinged on checkout and replaced if the ping fails.
+    """
+
+    def __init__(self, alias: str, db_config: Dict, max_size: int = 10,
+                 max_idle_time: float = 300, max_lifetime: float = 1800,
+                 checkout_timeout: float = 5, health_check_interval: float = 30,
+                 connect_timeout: int = 5, read_timeout: int = 5):
+        self.alias = alias
+        self.db_config = db_config
+        self.max_size = max_size
+        self.max_idle_time = max_idle_time
+        self.max_lifetime = max_lifetime
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+        self._idle = deque()
+        self._size = 0
+        self._cond = threading.Condition(threading.Lock())
+        self._stats = {
+            'created': 0,
+            'reused': 0,
+            'closed': 0,
+            'evicted_idle': 0,
+            'evicted_lifetime': 0,
+            'failed_health_checks': 0,
+            'waits': 0,
+            'timeouts': 0,
+        }
+
+    def _connect(self) -> _PooledConnection:
+        raw = pymysql.connect(
+            host=self.db_config.get('HOST'),
+            user=self.db_config.get('USER'),
+            password=self.db_config.get('PASSWORD'),
+            database=self.db_config.get('NAME'),
+            port=int(self.db_config.get('PORT') or 3306),
+            connect_timeout=self.connect_timeout,
+            read_timeout=self.read_timeout,
+            # Autocommit so a reused connection never keeps reading from an
+            # old REPEATABLE READ snapshot.
+            autocommit=True,
+        )
+        return _PooledConnection(raw)
+
+    def _close(self, conn: _PooledConnection):
+        try:
+            conn.raw.close()
+        except Exception:
+            pass
+
+    def _expired(self, conn: _PooledConnection, now: float) -> str:
+        """Return the eviction reason for `conn`, or '' if it is still usable"""
+        if self.max_lifetime and now - conn.created_at > self.max_lifetime:
+            return 'evicted_lifetime'
+        if self.max_idle_time and now - conn.last_used > self.max_idle_time:
+            return 'evicted_idle'
+        return ''
+
+    def _sweep(self, now: float, stale: List[_PooledConnection]):
+        """
+        Evict expired connections from the bottom of the idle stack, which
+        LIFO checkout would otherwise never reach. Called with the lock held;
+        the caller closes `stale` after releasing it.
+        """
+        while self._idle:
+            reason = self._expired(self._idle[0], now)
+            if not reason:
+                break
+            stale.append(self._idle.popleft())
+            self._size -= 1
+            self._stats[reason] += 1
+
+    def acquire(self) -> _PooledConnection:
+        """Check out a connection, opening a new one if the pool has room"""
+        deadline = time.monotonic() + self.checkout_timeout
+        while True:
+            stale = []
+            conn = None
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    self._sweep(now, stale)
+                    while self._idle:
+                        candidate = self._idle.pop()
+                        reason = self._expired(candidate, now)
+                        if reason:
+                            self._size -= 1
+                            self._stats[reason] += 1
+                            stale.append(candidate)
+                            continue
+                        conn = candidate
+                        break
+                    if conn is not None:
+                        break
+                    if self._size < self.max_size:
+                        # Reserve the slot; the connect happens outside the lock
+                        self._size += 1
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        for s in stale:
+                            self._close(s)
+                        raise PoolExhausted(
+                            f'No free connection to "{self.alias}" within '
+                            f'{self.checkout_timeout}s (max {self.max_size})'
+                        )
+                    self._stats['waits'] += 1
+                    self._cond.wait(remaining)
+
+            for s in stale:
+                self._close(s)
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._stats['created'] += 1
+                return conn
+
+            if time.monotonic() - conn.last_used > self.health_check_interval:
+                try:
+                    conn.raw.ping(reconnect=False)
+                except Exception:
+                    self._close(conn)
+                    with self._cond:
+                        self._size -= 1
+                        self._stats['failed_health_checks'] += 1
+                        self._cond.notify()
+                    continue
+
+            with self._cond:
+                self._stats['reused'] += 1
+            return conn
+
+    def release(self, conn: _PooledConnection, discard: bool = False):
+        """Return a connection to the pool, or close it if `discard` is set"""
+        if not discard and conn.raw.open:
+            conn.last_used = time.monotonic()
+            stale = []
+            with self._cond:
+                self._idle.append(conn)
+                self._sweep(conn.last_used, stale)
+                self._cond.notify()
+            for s in stale:
+                self._close(s)
+            return
+
+        self._close(conn)
+        with self._cond:
+            self._size -= 1
+            self._stats['closed'] += 1
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager yielding a raw pymysql connection.
+        Connection-level errors (see is_connection_error) discard the
+        connection; anything else returns it to the pool.
+        """
+        conn = self.acquire()
+        discard = False
+        try:
+            yield conn.raw
+        except pymysql.MySQLError as e:
+            discard = is_connection_error(e)
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    def close(self):
+        """Close all idle connections (checked-out ones close on release)"""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._stats['closed'] += len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            self._close(conn)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            data = dict(self._stats)
+            data.update({
+                'alias': self.alias,
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+            })
+        return data
+
+
+Address = Tuple[str, int]
+
+
+def parse_hosts(hosts: List[str], default_port) -> List[Address]:
+    """'host' / 'host:port' strings to (host, port) pairs"""
+    addrs = []
+    for item in hosts:
+        host, _, port = item.strip().partition(':')
+        if host:
+            addrs.append((host, int(port or default_port or 3306)))
+    return addrs
+
+
+class _HostState:
+    __slots__ = ('outstanding', 'latency', 'last_used', 'failures', 'down_until', 'requests', 'errors', 'marked_down')
+
+    def __init__(self):
+        self.outstanding = 0
+        self.latency = 0.0       # moving average of seconds per request
+        self.last_used = 0.0
+        self.failures = 0        # consecutive connection failures
+        self.down_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.marked_down = 0
+
+
+class HostSelector:
+    """
+    Chooses a host for each request among the primary and read replicas
+    of one practice database.
+
+    - Picks the host with the lowest (outstanding requests + 1) x average
+      latency, i.e. least-outstanding-requests weighted by how fast each
+      host has been answering. The average halves every LATENCY_HALF_LIFE
+      seconds a host goes unused, so a host that was slow once is retried.
+    - `failure_threshold` consecutive connection failures mark a host down
+      for `down_time` seconds; afterwards it gets traffic again and one more
+      failure takes it straight back down.
+    - When every host is down the one due back soonest is still tried, so
+      a full outage surfaces as the usual connection error.
+    """
+
+    LATENCY_HALF_LIFE = 10  # seconds
+
+    def __init__(self, alias: str, addrs: List[Address], failure_threshold: int = 3, down_time: float = 30):
+        self.alias = alias
+        self.addrs = list(addrs)
+        self.failure_threshold = failure_threshold
+        self.down_time = down_time
+        self._hosts = {addr: _HostState() for addr in self.addrs}
+        self._lock = threading.Lock()
+
+    def pick(self, exclude=()) -> Optional[Address]:
+        """Best host not in `exclude`, or None once every host has been tried"""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [a for a in self.addrs if a not in exclude]
+            if not candidates:
+                return None
+            up = [a for a in candidates if self._hosts[a].down_until <= now]
+            if not up:
+                return min(candidates, key=lambda a: self._hosts[a].down_until)
+            return min(up, key=lambda a: self._load(self._hosts[a], now))
+
+    def _load(self, host: _HostState, now: float) -> float:
+        latency = host.latency * 0.5 ** ((now - host.last_used) / self.LATENCY_HALF_LIFE)
+        return (host.outstanding + 1) * max(latency, 1e-3)
+
+    def begin(self, addr: Address):
+        with self._lock:
+            host = self._hosts[addr]
+            host.outstanding += 1
+            host.requests += 1
+
+    def end(self, addr: Address, elapsed: float, failed: bool = False):
+        with self._lock:
+            host = self._hosts[addr]
+            host.outstanding -= 1
+            host.latency = elapsed if not host.latency else 0.8 * host.latency + 0.2 * elapsed
+            host.last_used = time.monotonic()
+        if failed:
+            self.failure(addr)
+        else:
+            self.success(addr)
+
+    def success(self, addr: Address):
+        with self._lock:
+            host = self._hosts[addr]
+            host.failures = 0
+            if host.down_until <= time.monotonic():
+                host.down_until = 0.0
+
+    def failure(self, addr: Address):
+        """A connect, health check or connection-level error on `addr`"""
+        with self._lock:
+            host = self._hosts[addr]
+            host.failures += 1
+            host.errors += 1
+            # Past the threshold (or on probation after being down) -> down again
+            if host.failures >= self.failure_threshold or host.down_until:
+                if host.down_until <= time.monotonic():
+                    host.marked_down += 1
+                host.down_until = time.monotonic() + self.down_time
+
+    def stats(self) -> Dict[str, Dict]:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                f'{host}:{port}': {
+                    'up': state.down_until <= now,
+                    'outstanding': state.outstanding,
+                    'avg_latency': round(state.latency, 4),
+                    'requests': state.requests,
+                    'errors': state.errors,
+                    'marked_down': state.marked_down,
+                }
+                for (host, port), state in self._hosts.items()
+            }
+
+
+class ReplicatedPool:
+    """
+    One ConnectionPool per host of a practice database, with a
+    HostSelector choosing among them. Same connection() / stats() / close()
+    interface as ConnectionPool. Checkout fails over to the next host when
+    a host can't be connected to or its pool is exhausted; a statement that
+    already started is not retried.
+    """
+
+    def __init__(self, alias: str, db_config: Dict, selector: HostSelector, **pool_options):
+        self.alias = alias
+        self.selector = selector
+        self.pools = {
+            addr: ConnectionPool(alias, dict(db_config, HOST=addr[0], PORT=addr[1]), **pool_options)
+            for addr in selector.addrs
+        }
+
+    def _acquire(self):
+        tried = []
+        last_error = None
+        while True:
+            addr = self.selector.pick(exclude=tried)
+            if addr is None:
+                raise last_error or PoolExhausted(f'No hosts configured for "{self.alias}"')
+            tried.append(addr)
+            try:
+                return addr, self.pools[addr].acquire()
+            except PoolExhausted as e:
+                last_error = e
+            except pymysql.MySQLError as e:
+                self.selector.failure(addr)
+                last_error = e
+
+    @contextmanager
+    def connection(self):
+        addr, conn = self._acquire()
+        pool = self.pools[addr]
+        self.selector.begin(addr)
+        started = time.monotonic()
+        discard = False
+        try:
+            yield conn.raw
+        except pymysql.MySQLError as e:
+            discard = is_connection_error(e)
+            raise
+        finally:
+            self.selector.end(addr, time.monotonic() - started, failed=discard)
+            pool.release(conn, discard=discard)
+
+    def close(self):
+        for pool in self.pools.values():
+            pool.close()
+
+    def stats(self) -> Dict:
+        hosts = self.selector.stats()
+        for addr, pool in self.pools.items():
+            hosts[f'{addr[0]}:{addr[1]}'].update(pool.stats())
+        return {'alias': self.alias, 'hosts': hosts}
+
+
+_selectors: Dict[str, Optional[HostSelector]] = {}
+
+
+def get_host_selector(db_name: str) -> Optional[HostSelector]:
+    """
+    The HostSelector for an alias with read replicas configured
+    (settings.SQL_READ_REPLICAS), or None if it only has its HOST.
+    Shared by the sync pools and the async executor.
+    """
+    if db_name in _selectors:
+        return _selectors[db_name]
+    replicas = getattr(settings, 'SQL_READ_REPLICAS', {}).get(db_name) or []
+    selector = None
+    if replicas:
+        db_config = settings.DATABASES[db_name]
+        port = db_config.get('PORT')
+        addrs = parse_hosts(replicas, port)
+        if getattr(settings, 'SQL_REPLICA_INCLUDE_PRIMARY', True):
+            addrs.insert(0, (db_config.get('HOST'), int(port or 3306)))
+        addrs = list(dict.fromkeys(addrs))
+        selector = HostSelector(
+            db_name, addrs,
+            failure_threshold=getattr(settings, 'SQL_REPLICA_FAILURE_THRESHOLD', 3),
+            down_time=getattr(settings, 'SQL_REPLICA_DOWN_TIME', 30),
+        )
+    with _pools_lock:
+        return _selectors.setdefault(db_name, selector)
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_name: str) -> ConnectionPool:
+    """
+    Return the process-wide pool for a `settings.DATABASES` alias
+    (a ReplicatedPool if it has read replicas).
+    Raises ValueError for unknown aliases, like SQLExecutor does.
+    """
+    pool = _pools.get(db_name)
+    if pool is not None:
+        return pool
+
+    if db_name not in settings.DATABASES:
+        raise ValueError(f"Invalid database: {db_name}")
+
+    selector = get_host_selector(db_name)
+    with _pools_lock:
+        pool = _pools.get(db_name)
+        if pool is None:
+            options = dict(
+                max_size=getattr(settings, 'SQL_POOL_MAX_SIZE', 10),
+                max_idle_time=getattr(settings, 'SQL_POOL_MAX_IDLE_TIME', 300),
+                max_lifetime=getattr(settings, 'SQL_POOL_MAX_LIFETIME', 1800),
+                checkout_timeout=getattr(settings, 'SQL_POOL_CHECKOUT_TIMEOUT', 5),
+                health_check_interval=getattr(settings, 'SQL_POOL_HEALTH_CHECK_INTERVAL', 30),
+                # Statements are stopped server-side (max_execution_time plus
+                # the watchdog); the client timeout is only a last resort
+                read_timeout=getattr(settings, 'SQL_MAX_TIME_LIMIT', 30) + 2,
+            )
+            if selector:
+                pool = ReplicatedPool(db_name, settings.DATABASES[db_name], selector, **options)
+            else:
+                pool = ConnectionPool(db_name, settings.DATABASES[db_name], **options)
+            _pools[db_name] = pool
+    return pool
+
+
+def pool_stats() -> Dict[str, Dict]:
+    """Stats for every pool created so far, keyed by database alias"""
+    return {name: pool.stats() for name, pool in list(_pools.items())}
+
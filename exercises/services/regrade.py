@@ -0,0 +1,121 @@
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+from django.conf import settings
+from django.db import models as dj_models
+from django.utils import timezone
+
+from .comparator import has_order_by, order_by_terms
+from .result_cache import peek_expected_result, store_expected_result
+from .validator import normalize_sql
+
+
+def _query_key(query: str) -> str:
+    # Queries that differ only in whitespace or comments
+    # share one run; invalid ones are keyed by their raw text
+    text = normalize_sql(query) or query.strip()
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def regrade_exercise(executor, exercise, db_name: str, expected_sql: Callable,
+                     revoke: bool = False, workers: int = None) -> Dict:
+    """
+    Re-grade every Submission of an exercise, and the completed
+    UserProgress rows by the query that completed them, against the
+    current expected_sql. last_query is never used: every Run overwrites
+    it, so it says nothing about what was submitted.
+
+    The expected result is computed once (or taken from the cache), each
+    distinct query runs once on a bounded thread pool, and the rows are
+    written back with bulk_update. Progress of a user whose Submission is
+    now correct is marked completed; with `revoke`, completed progress
+    whose completed_query is now wrong is reset as well (rows completed
+    before completed_query was recorded are left alone).
+
+    `expected_sql(exercise, db_name)` returns the SQL to run for the
+    expected result, as for run_submission.
+    Returns counts for the response/command output, or {'error': ...}.
+    """
+    from ..models import Submission, UserProgress
+
+    start_time = time.time()
+    expected_result = peek_expected_result(exercise, db_name)
+    if expected_result is None:
+        expected_result = executor.execute(expected_sql(exercise, db_name), check_plan=False)
+        store_expected_result(exercise, db_name, expected_result)
+    if not expected_result['success']:
+        return {'error': f'Expected query execution failed: {expected_result.get("error")}'}
+
+    submissions = list(Submission.objects.filter(exercise=exercise)
+                       .only('id', 'user_id', 'query', 'status', 'execution_time', 'created_at'))
+    progress = list(UserProgress.objects.filter(exercise=exercise)
+                    .filter(dj_models.Q(completed=False, user__isnull=False) | ~dj_models.Q(completed_query=''))
+                    .only('id', 'user_id', 'completed', 'completed_query', 'completed_at'))
+
+    queries = {}
+    for sub in submissions:
+        queries.setdefault(_query_key(sub.query), sub.query)
+    for up in progress:
+        if up.completed:
+            queries.setdefault(_query_key(up.completed_query), up.completed_query)
+
+    ordered = has_order_by(exercise.expected_sql)
+    order_by = order_by_terms(exercise.expected_sql)
+
+    def grade(query):
+        result = executor.execute(query)
+        comparison = executor.compare_results(result, expected_result, ordered=ordered,
+                                              options=exercise.grading_options, order_by=order_by)
+        return comparison['correct'], result.get('execution_time')
+
+    # Bounded so a re-grade can't take every pooled connection from live traffic
+    max_workers = workers or getattr(settings, 'REGRADE_WORKERS', 4)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='regrade') as pool:
+        verdicts = dict(zip(queries, pool.map(grade, queries.values())))
+
+    now = timezone.now()
+    changed_submissions = []
+    for sub in submissions:
+        correct, execution_time = verdicts[_query_key(sub.query)]
+        new_status = 'correct' if correct else 'incorrect'
+        if sub.status != new_status:
+            sub.status = new_status
+            sub.execution_time = execution_time
+            sub.updated_at = now
+            changed_submissions.append(sub)
+
+    # Earliest now-correct submission of each user (submissions are newest first)
+    solved_by = {}
+    for sub in submissions:
+        if sub.status == 'correct':
+            solved_by[sub.user_id] = sub
+
+    changed_progress = []
+    for up in progress:
+        if not up.completed:
+            sub = solved_by.get(up.user_id)
+            if sub is None:
+                continue
+            up.completed, up.completed_query, up.completed_at = True, sub.query, now
+        elif revoke and not verdicts[_query_key(up.completed_query)][0]:
+            up.completed, up.completed_query, up.completed_at = False, '', None
+        else:
+            continue
+        up.updated_at = now
+        changed_progress.append(up)
+
+    Submission.objects.bulk_update(changed_submissions, ['status', 'execution_time', 'updated_at'], batch_size=500)
+    UserProgress.objects.bulk_update(changed_progress, ['completed', 'completed_query', 'completed_at', 'updated_at'],
+                                     batch_size=500)
+
+    return {
+        'submissions': len(submissions),
+        'progress': len(progress),
+        'distinct_queries': len(queries),
+        'correct_queries': sum(1 for correct, _ in verdicts.values() if correct),
+        'submissions_changed': len(changed_submissions),
+        'progress_changed': len(changed_progress),
+        'elapsed': round(time.time() - start_time, 3),
+    }
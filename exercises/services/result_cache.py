@@ -0,0 +1,183 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional
+
+from django.conf import settings
+
+
+class TTLCache:
+    """
+    Small thread-safe in-process cache with LRU eviction and a per-entry TTL.
+    Besides the entry count it can bound the total `weight` of its values
+    (e.g. result cells), evicting least recently used entries first.
+    Values are returned as stored, so callers must not mutate them.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl: float = 3600, max_weight: int = None):
+        self.max_entries = max_entries
+        self.max_weight = max_weight
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._weight = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key: Hashable):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            expires_at, weight, value = entry
+            if expires_at <= now:
+                del self._data[key]
+                self._weight -= weight
+                self._misses += 1
+                return None
+            self._data.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def set(self, key: Hashable, value, weight: int = 1):
+        if self.max_weight is not None and weight > self.max_weight:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._weight -= old[1]
+            self._data[key] = (time.monotonic() + self.ttl, weight, value)
+            self._weight += weight
+            while len(self._data) > self.max_entries or (
+                    self.max_weight is not None and self._weight > self.max_weight):
+                _, (_, evicted_weight, _) = self._data.popitem(last=False)
+                self._weight -= evicted_weight
+                self._evictions += 1
+
+    def delete_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drop every entry whose key matches `predicate`; returns the count"""
+        with self._lock:
+            doomed = [k for k in self._data if predicate(k)]
+            for k in doomed:
+                self._weight -= self._data.pop(k)[1]
+        return len(doomed)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._weight = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'max_entries': self.max_entries,
+                'weight': self._weight,
+                'max_weight': self.max_weight,
+                'ttl': self.ttl,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+            }
+
+
+# Results of Exercise.expected_sql, keyed by
+# (exercise id, sha1 of expected_sql, db alias, schema version)
+expected_results = TTLCache(
+    max_entries=getattr(settings, 'EXPECTED_RESULT_CACHE_SIZE', 512),
+    ttl=getattr(settings, 'EXPECTED_RESULT_CACHE_TTL', 3600),
+)
+
+
+def _sql_hash(sql: str) -> str:
+    return hashlib.sha1(sql.encode('utf-8')).hexdigest()
+
+
+def expected_result_key(exercise, db_name: str) -> tuple:
+    """
+    Cache key for an exercise's reference result.
+    The schema's updated_at is part of the key so reseeding (which touches
+    it) invalidates entries in every worker process, not only this one.
+    """
+    schema_version = exercise.schema.updated_at.timestamp() if exercise.schema.updated_at else 0
+    return (exercise.id, _sql_hash(exercise.expected_sql), db_name, schema_version)
+
+
+def peek_expected_result(exercise, db_name: str) -> Optional[Dict]:
+    """Cached expected result for `exercise` on `db_name`, or None"""
+    return expected_results.get(expected_result_key(exercise, db_name))
+
+
+def store_expected_result(exercise, db_name: str, result: Dict):
+    """Cache `result` as the expected result; failed results are never cached"""
+    if result.get('success'):
+        expected_results.set(expected_result_key(exercise, db_name), result)
+
+
+def invalidate_exercise(exercise_id: int) -> int:
+    return expected_results.delete_where(lambda key: key[0] == exercise_id)
+
+
+def invalidate_database(db_name: Optional[str] = None) -> int:
+    """Forget cached results for one database alias, or for all of them"""
+    if db_name is None:
+        count = expected_results.stats()['entries']
+        expected_results.clear()
+        return count
+    return expected_results.delete_where(lambda key: key[2] == db_name)
+
+
+# Results of student queries, keyed by (db alias, SQLExecutor._cache_key). The
+# practice databases are read-only during a session, so identical Run
+# clicks across a lab can be answered without touching MySQL.
+query_results = TTLCache(
+    max_entries=getattr(settings, 'QUERY_RESULT_CACHE_SIZE', 2048),
+    ttl=getattr(settings, 'QUERY_RESULT_CACHE_TTL', 300),
+    max_weight=getattr(settings, 'QUERY_RESULT_CACHE_MAX_CELLS', 2_000_000),
+)
+
+
+def query_cache_enabled() -> bool:
+    return getattr(settings, 'QUERY_RESULT_CACHE_ENABLED', True)
+
+
+def get_cached_query_result(db_name: str, key: Hashable) -> Optional[Dict]:
+    """
+    Cached result for a query (`key` from SQLExecutor._cache_key: the
+    normalized SQL and execution settings), as a fresh dict marked 'cached'.
+    Row data is shared with the cache entry and must not be mutated.
+    """
+    result = query_results.get((db_name, key))
+    if result is None:
+        return None
+    result = dict(result)
+    result['cached'] = True
+    return result
+
+
+def store_query_result(db_name: str, key: Hashable, result: Dict):
+    """Cache a successful result; weight is its number of cells"""
+    if not result.get('success'):
+        return
+    weight = result['row_count'] * max(len(result['columns']), 1) + 1
+    query_results.set((db_name, key), result, weight=weight)
+
+
+def invalidate_query_results(db_name: Optional[str] = None) -> int:
+    """Forget cached query results for one database alias, or for all of them"""
+    if db_name is None:
+        count = query_results.stats()['entries']
+        query_results.clear()
+        return count
+    return query_results.delete_where(lambda key: key[0] == db_name)
+
+
+def cache_stats() -> Dict[str, Dict]:
+    return {
+        'expected_results': expected_results.stats(),
+        'query_results': query_results.stats(),
+    }
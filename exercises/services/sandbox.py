@@ -0,0 +1,542 @@
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import sqlparse
+from django.conf import settings
+from sqlparse import sql as S
+from sqlparse import tokens as T
+
+from .comparator import result_kinds
+from .executor import SQLExecutor
+
+
+class SandboxUnsupported(Exception):
+    """The query (or schema) can't be run faithfully on SQLite; use MySQL instead"""
+
+
+# ============================================
+# MySQL -> SQLite translation
+# ============================================
+
+# Functions that behave the same on both engines for practice data
+_SAME_FUNCTIONS = {
+    'COUNT', 'SUM', 'AVG', 'MIN', 'MAX', 'ABS', 'ROUND', 'UPPER', 'LOWER',
+    'TRIM', 'LTRIM', 'RTRIM', 'COALESCE', 'IFNULL', 'NULLIF',
+    'SUBSTR', 'REPLACE', 'INSTR', 'ROW_NUMBER', 'RANK', 'DENSE_RANK',
+    'NTILE', 'LAG', 'LEAD', 'FIRST_VALUE', 'LAST_VALUE',
+}
+
+# MySQL functions rewritten into SQLite expressions ({0}, {1}... are the arguments)
+_FUNCTION_TEMPLATES = {
+    'UCASE': ('UPPER({0})', 1),
+    'LCASE': ('LOWER({0})', 1),
+    'CHAR_LENGTH': ('LENGTH({0})', 1),
+    # MySQL's LENGTH() counts bytes, SQLite's counts characters of text
+    'LENGTH': ('LENGTH(CAST({0} AS BLOB))', 1),
+    'IF': ('(CASE WHEN {0} THEN {1} ELSE {2} END)', 3),
+    'YEAR': ("CAST(strftime('%Y', {0}) AS INTEGER)", 1),
+    'MONTH': ("CAST(strftime('%m', {0}) AS INTEGER)", 1),
+    'DAY': ("CAST(strftime('%d', {0}) AS INTEGER)", 1),
+    'DAYOFMONTH': ("CAST(strftime('%d', {0}) AS INTEGER)", 1),
+    'DATEDIFF': ('CAST(julianday(date({0})) - julianday(date({1})) AS INTEGER)', 2),
+}
+
+# Tokens whose meaning differs between the engines: `/` is integer
+# division on SQLite, `||` is OR on MySQL, and the rest don't exist there
+_UNSUPPORTED_OPERATORS = {'/', '||', '<=>'}
+_UNSUPPORTED_KEYWORDS = {
+    'DIV', 'REGEXP', 'RLIKE', 'INTERVAL', 'SEPARATOR', 'ROLLUP', 'STRAIGHT_JOIN',
+    'SQL_CALC_FOUND_ROWS', 'BINARY', 'COLLATE', 'XOR', 'FOR UPDATE',
+}
+if sqlite3.sqlite_version_info < (3, 39):
+    _UNSUPPORTED_KEYWORDS |= {'RIGHT JOIN', 'RIGHT OUTER JOIN', 'FULL JOIN', 'FULL OUTER JOIN'}
+
+_AGGREGATES = {
+    'COUNT', 'SUM', 'AVG', 'MIN', 'MAX', 'GROUP_CONCAT', 'STD', 'STDDEV',
+    'STDDEV_POP', 'STDDEV_SAMP', 'VARIANCE', 'VAR_POP', 'VAR_SAMP',
+    'BIT_AND', 'BIT_OR', 'BIT_XOR', 'JSON_ARRAYAGG', 'JSON_OBJECTAGG',
+}
+
+
+def _render_function(func: S.Function) -> str:
+    name = func.get_name() or ''
+    upper = name.upper()
+    if upper in _SAME_FUNCTIONS:
+        return ''.join(_render(t) for t in func.tokens)
+    args = [_render(p) for p in func.get_parameters()]
+    if upper == 'SUBSTRING':
+        return 'SUBSTR(' + ', '.join(args) + ')'
+    if upper == 'CONCAT':
+        # CONCAT is NULL if any argument is NULL, like ||
+        return '(' + ' || '.join(args) + ')' if args else "''"
+    template = _FUNCTION_TEMPLATES.get(upper)
+    if template is None or len(args) != template[1]:
+        raise SandboxUnsupported(f'{name}() is not available locally')
+    return template[0].format(*args)
+
+
+def _render(token) -> str:
+    if isinstance(token, S.Function):
+        return _render_function(token)
+    if token.is_group:
+        return ''.join(_render(t) for t in token.tokens)
+    if token.ttype in T.Literal.String.Symbol and token.value.startswith('"'):
+        # A string on MySQL, an identifier on SQLite
+        raise SandboxUnsupported('double-quoted strings')
+    if token.ttype in T.Operator and token.value in _UNSUPPORTED_OPERATORS:
+        raise SandboxUnsupported(f'operator {token.value}')
+    if token.ttype in T.Keyword and ' '.join(token.normalized.split()) in _UNSUPPORTED_KEYWORDS:
+        raise SandboxUnsupported(f'keyword {token.normalized}')
+    return token.value
+
+
+def _render_select_item(token) -> str:
+    rendered = _render(token)
+    if rendered != token.value and not (isinstance(token, S.Identifier) and token.has_alias()):
+        # MySQL names the column after the expression as written
+        rendered += ' AS "' + token.value.replace('"', '""') + '"'
+    return rendered
+
+
+def _compact(token) -> str:
+    return ''.join(token.value.split()).lower()
+
+
+def _expression(token):
+    """A select item without its alias"""
+    if isinstance(token, S.Identifier) and token.has_alias():
+        for i, t in enumerate(token.tokens):
+            if t.is_whitespace:
+                return S.TokenList(token.tokens[:i])
+    return token
+
+
+def _is_aggregate(token) -> bool:
+    """An aggregate call; with OVER (...) it's a window function instead"""
+    return (isinstance(token, S.Function) and (token.get_name() or '').upper() in _AGGREGATES
+            and not any(isinstance(t, S.Over) for t in token.tokens))
+
+
+def _column_names(token):
+    """Unqualified column names an expression uses outside aggregate calls"""
+    if isinstance(token, S.Function):
+        if _is_aggregate(token):
+            return
+        children = token.tokens[1:]  # skip the function name
+    elif isinstance(token, S.Identifier) and all(t.ttype in T.Name or t.ttype in T.Punctuation for t in token.tokens):
+        yield token.get_real_name().strip('`').lower()
+        return
+    elif token.is_group:
+        children = token.tokens
+    else:
+        if token.ttype in T.Name:
+            yield token.value.strip('`').lower()
+        elif token.ttype in T.Wildcard:
+            yield '*'
+        return
+    for child in children:
+        yield from _column_names(child)
+
+
+def _has_aggregate(token) -> bool:
+    if _is_aggregate(token):
+        return True
+    return token.is_group and any(_has_aggregate(t) for t in token.tokens)
+
+
+def _split_items(token):
+    if isinstance(token, S.IdentifierList):
+        return [t for t in token.tokens if not t.is_whitespace and t.ttype not in T.Punctuation]
+    return [token]
+
+
+def _check_grouping(statement):
+    """
+    MySQL's ONLY_FULL_GROUP_BY rejects select items that are neither
+    aggregated nor grouped by, where SQLite would pick a value from an
+    arbitrary row. Such queries (and subqueries) are left to MySQL, as are
+    columns MySQL might accept for being functionally dependent on the key.
+    """
+    items, group_by = [], None
+    in_select = False
+    tokens = [t for t in statement.tokens if not t.is_whitespace]
+    for i, token in enumerate(tokens):
+        if token.ttype in T.DML:
+            in_select = True
+        elif token.ttype in T.Keyword and token.normalized != 'DISTINCT':
+            in_select = False
+            if ' '.join(token.normalized.split()) == 'GROUP BY' and i + 1 < len(tokens):
+                group_by = _split_items(tokens[i + 1])
+        elif in_select and token.ttype not in T.Punctuation:
+            items.extend(_split_items(token))
+    for token in statement.get_sublists():
+        _check_grouping(token)
+
+    expressions = [_expression(item) for item in items]
+    if group_by is None and not any(_has_aggregate(e) for e in expressions):
+        return
+    grouped = set()
+    for term in group_by or []:
+        if term.ttype in T.Number.Integer and 1 <= int(term.value) <= len(items):
+            grouped.add(_compact(expressions[int(term.value) - 1]))
+        else:
+            grouped.add(_compact(term))
+            grouped.update(_column_names(term))
+    for item, expression in zip(items, expressions):
+        alias = item.get_alias() if isinstance(item, S.Identifier) else None
+        if _compact(expression) in grouped or (alias and alias.lower() in grouped):
+            continue
+        if any(name not in grouped for name in _column_names(expression)):
+            raise SandboxUnsupported('non-aggregated column outside GROUP BY')
+
+
+def translate_query(query: str) -> str:
+    """
+    Rewrite a validated MySQL SELECT for SQLite. Functions outside a small
+    list known to behave alike (or rewritable, such as YEAR() or CONCAT())
+    and constructs whose semantics differ (see also _check_grouping)
+    raise SandboxUnsupported.
+    Rewritten select-list expressions keep their MySQL column names.
+    """
+    statements = [s for s in sqlparse.parse(query) if s.value.strip()]
+    if len(statements) != 1:
+        raise SandboxUnsupported('expected a single statement')
+    _check_grouping(statements[0])
+
+    parts = []
+    in_select = False
+    for token in statements[0].tokens:
+        if token.ttype in T.DML:
+            in_select = True
+        elif token.ttype in T.Keyword and token.normalized != 'DISTINCT':
+            in_select = False
+        elif in_select and isinstance(token, S.IdentifierList):
+            parts.append(''.join(
+                t.value if t.is_whitespace or t.ttype in T.Punctuation else _render_select_item(t)
+                for t in token.tokens
+            ))
+            continue
+        elif in_select and not token.is_whitespace:
+            parts.append(_render_select_item(token))
+            continue
+        parts.append(_render(token))
+    return ''.join(parts).strip().rstrip(';')
+
+
+# Rewrites applied to the whole script (they may span string literals)
+_SCRIPT_REWRITES = [
+    # Statements SQLite has no use for
+    (re.compile(r'(\A|;)(\s*)(SET|USE|LOCK\s+TABLES|UNLOCK\s+TABLES|CREATE\s+DATABASE|DROP\s+DATABASE)\b[^;]*;', re.I), r'\1\2'),
+    (re.compile(r'/\*!.*?\*/\s*;?', re.S), ''),
+]
+
+# Column and table options in schema_sql, applied outside string literals
+# except for COMMENT and ENUM, which contain them
+_DDL_REWRITES = [
+    (re.compile(r"\bCOMMENT\s*=?\s*'(?:[^']|'')*'", re.I), ''),
+    (re.compile(r"\b(ENUM|SET)\s*\((?:[^')]|'(?:[^']|'')*')*\)", re.I), 'TEXT'),
+]
+_DDL_TOKEN_REWRITES = [
+    (re.compile(r'\bENGINE\s*=\s*\w+', re.I), ''),
+    (re.compile(r'\b(DEFAULT\s+)?(CHARSET|CHARACTER\s+SET)\s*=?\s*\w+', re.I), ''),
+    (re.compile(r'\bCOLLATE\s*=?\s*\w+', re.I), ''),
+    (re.compile(r'\bAUTO_INCREMENT(\s*=\s*\d+)?', re.I), ''),
+    (re.compile(r'\bUNSIGNED\b', re.I), ''),
+    (re.compile(r'\bON\s+UPDATE\s+CURRENT_TIMESTAMP(\(\d*\))?', re.I), ''),
+    # Inline secondary indexes
+    (re.compile(r',\s*(UNIQUE\s+|FULLTEXT\s+)?(KEY|INDEX)\s+[`"\w]*\s*\([^)]*\)', re.I), ''),
+    # MySQL's default collations compare strings case-insensitively
+    (re.compile(r'([`"\w]+\s+)((?:VAR)?CHAR\s*\(\s*\d+\s*\)|(?:TINY|MEDIUM|LONG)?TEXT\b)', re.I), r'\1\2 COLLATE NOCASE'),
+]
+
+
+def _unescape_strings(script: str) -> str:
+    """Turn MySQL backslash escapes inside '...' literals into SQLite's '' form"""
+    out = []
+    in_string = False
+    i = 0
+    while i < len(script):
+        ch = script[i]
+        if in_string and ch == '\\' and i + 1 < len(script):
+            nxt = script[i + 1]
+            out.append({"'": "''", 'n': '\n', 't': '\t', 'r': '\r', '0': ''}.get(nxt, nxt))
+            i += 2
+            continue
+        if ch == "'":
+            in_string = not in_string
+        out.append(ch)
+        i += 1
+    return ''.join(out)
+
+
+def translate_script(script: str, ddl: bool = False) -> str:
+    """
+    Best-effort rewrite of a MySQL script for SQLite: schema_sql (`ddl`)
+    or seed_sql. Whatever SQLite still rejects makes the sandbox unavailable
+    for that schema.
+    """
+    script = _unescape_strings(script or '')
+    for pattern, replacement in _SCRIPT_REWRITES:
+        script = pattern.sub(replacement, script)
+    if not ddl:
+        return script
+    for pattern, replacement in _DDL_REWRITES:
+        script = pattern.sub(replacement, script)
+    # Even parts are outside '...' literals ('' escapes toggle twice)
+    parts = script.split("'")
+    for i in range(0, len(parts), 2):
+        for pattern, replacement in _DDL_TOKEN_REWRITES:
+            parts[i] = pattern.sub(replacement, parts[i])
+    return "'".join(parts)
+
+
+# ============================================
+# Per-process sandboxes
+# ============================================
+
+def snapshot_path(schema) -> Optional[str]:
+    """
+    Template file for a DatabaseSchema version under settings.SQL_SANDBOX_DIR,
+    or None when file snapshots are disabled (SQL_SANDBOX_DIR = '').
+    """
+    directory = getattr(settings, 'SQL_SANDBOX_DIR', '')
+    if not directory:
+        return None
+    version = int(schema.updated_at.timestamp() * 1_000_000) if schema.updated_at else 0
+    return os.path.join(directory, f'schema_{schema.pk}_{version}.sqlite3')
+
+
+def _load_scripts(conn: sqlite3.Connection, schema):
+    try:
+        conn.executescript(translate_script(schema.schema_sql, ddl=True))
+        conn.executescript(translate_script(schema.seed_sql))
+    except sqlite3.Error as e:
+        raise SandboxUnsupported(f'schema {schema.name} could not be loaded: {e}')
+
+
+def build_snapshot(schema, force: bool = False) -> Optional[str]:
+    """
+    Build the template file for `schema` unless it already exists. The file
+    is written under a temporary name and renamed into place, so workers
+    building concurrently never see a partial snapshot. Older versions of
+    the same schema are removed. Returns the path (None if disabled).
+    """
+    path = snapshot_path(schema)
+    if path is None or (os.path.exists(path) and not force):
+        return path
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(tmp)
+        try:
+            _load_scripts(conn, schema)
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+    prefix = f'schema_{schema.pk}_'
+    for name in os.listdir(os.path.dirname(path)):
+        old = os.path.join(os.path.dirname(path), name)
+        if name.startswith(prefix) and name.endswith('.sqlite3') and old != path:
+            try:
+                os.unlink(old)
+            except OSError:
+                pass
+    return path
+
+
+class SchemaSandbox:
+    """
+    In-memory SQLite copy of one DatabaseSchema (schema_sql + seed_sql).
+
+    The template is loaded once per process from the schema's snapshot file
+    (built by the first worker that needs it, or by apply_seed), so the
+    scripts run once per schema version rather than once per worker. Copies
+    come from the template through the SQLite backup API, a page copy that
+    takes microseconds for practice-sized data:
+      - connection(): a per-thread read-only copy, reused across requests
+        (connections can't be shared between threads)
+      - clone(): a private writable copy for one request, discarded after
+    """
+
+    def __init__(self, schema):
+        self.schema_id = schema.pk
+        self.version = schema.updated_at
+        self._template = sqlite3.connect(':memory:', check_same_thread=False)
+        self._template_lock = threading.Lock()
+        self._local = threading.local()
+        try:
+            path = build_snapshot(schema)
+            if path is None:
+                _load_scripts(self._template, schema)
+            else:
+                source = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+                try:
+                    source.backup(self._template)
+                finally:
+                    source.close()
+        except (SandboxUnsupported, sqlite3.Error, OSError) as e:
+            self._template.close()
+            if isinstance(e, SandboxUnsupported):
+                raise
+            raise SandboxUnsupported(f'snapshot for {schema.name} could not be loaded: {e}')
+
+    def _copy(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(':memory:')
+        with self._template_lock:
+            self._template.backup(conn)
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._copy()
+            conn.execute('PRAGMA query_only = ON')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def clone(self):
+        """Writable copy isolated to the caller (e.g. one DML exercise attempt)"""
+        conn = self._copy()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+
+_sandboxes: Dict[int, Optional[SchemaSandbox]] = {}
+_failed: Dict[int, object] = {}
+_sandboxes_lock = threading.Lock()
+
+
+def sandbox_enabled() -> bool:
+    return getattr(settings, 'SQL_LOCAL_SANDBOX', False)
+
+
+def get_sandbox(schema) -> Optional[SchemaSandbox]:
+    """
+    Sandbox for a DatabaseSchema, rebuilt when schema.updated_at changes.
+    Returns None if the schema has no SQL or couldn't be translated
+    (remembered per version so the build isn't retried on every request).
+    """
+    if not schema.schema_sql:
+        return None
+    sandbox = _sandboxes.get(schema.pk)
+    if sandbox is not None and sandbox.version == schema.updated_at:
+        return sandbox
+    if _failed.get(schema.pk) == schema.updated_at:
+        return None
+
+    with _sandboxes_lock:
+        sandbox = _sandboxes.get(schema.pk)
+        if sandbox is None or sandbox.version != schema.updated_at:
+            try:
+                sandbox = SchemaSandbox(schema)
+            except SandboxUnsupported:
+                _failed[schema.pk] = schema.updated_at
+                _sandboxes.pop(schema.pk, None)
+                return None
+            _sandboxes[schema.pk] = sandbox
+    return sandbox
+
+
+def invalidate_sandboxes():
+    with _sandboxes_lock:
+        _sandboxes.clear()
+        _failed.clear()
+
+
+class LocalSQLExecutor(SQLExecutor):
+    """
+    SQLExecutor variant that runs queries on the process-local SQLite
+    sandbox of an exercise's schema. `execute` raises SandboxUnsupported
+    for queries that need MySQL (unsupported syntax, or any SQLite error,
+    so students still see MySQL's error messages); validation failures
+    and timeouts are returned as usual.
+    """
+
+    def __init__(self, sandbox: SchemaSandbox, db_name: str, time_limit: float = None):
+        # No MySQL alias needed, so the base initializer is skipped
+        self.sandbox = sandbox
+        self.db_name = db_name
+        self.db_config = {}
+        self.time_limit = min(time_limit or self.MAX_EXECUTION_TIME,
+                              getattr(settings, 'SQL_MAX_TIME_LIMIT', 30))
+
+    def execute(self, query: str, check_plan: bool = True) -> Dict:
+        is_valid, error = self.validate_query(query)
+        if not is_valid:
+            return {
+                'success': False,
+                'error': error,
+                'error_type': 'validation',
+                'columns': [],
+                'rows': [],
+                'row_count': 0,
+                'execution_time': 0
+            }
+
+        local_query = translate_query(query)
+        start_time = time.time()
+        deadline = time.monotonic() + self.time_limit
+        conn = self.sandbox.connection()
+        # Abort the statement once it is over the time limit
+        conn.set_progress_handler(lambda: time.monotonic() > deadline, 10000)
+        try:
+            cursor = conn.execute(local_query)
+            columns = [desc[0] for desc in cursor.description] if cursor.description else []
+            rows = cursor.fetchmany(self.MAX_ROWS)
+            truncated = len(rows) == self.MAX_ROWS and cursor.fetchone() is not None
+            cursor.close()
+        except sqlite3.OperationalError as e:
+            if time.monotonic() > deadline and 'interrupted' in str(e):
+                return self._timeout_failure(start_time)
+            raise SandboxUnsupported(str(e))
+        except sqlite3.Error as e:
+            raise SandboxUnsupported(str(e))
+        finally:
+            conn.set_progress_handler(None, 0)
+
+        result = {
+            'success': True,
+            'columns': columns,
+            'rows': rows,
+            'row_count': len(rows),
+            'truncated': truncated,
+            'execution_time': round(time.time() - start_time, 3),
+            'error': None,
+            'local': True,
+        }
+        # SQLite has no column types to report; infer them from the values
+        result['column_types'] = result_kinds(result)
+        result['fingerprint'] = self._fingerprint(result)
+        return result
+
+
+def get_local_executor(exercise, db_name: str) -> Optional[LocalSQLExecutor]:
+    """
+    LocalSQLExecutor for an exercise, or None if the sandbox is off or
+    unavailable. The sandbox is built from the exercise's schema_sql and
+    seed_sql, so it only stands in for the schema's own database: an
+    exercise graded on another alias (e.g. a WS database picked from the
+    title, whose data differs) always runs on MySQL.
+    """
+    if not sandbox_enabled() or db_name != exercise.schema.db_name:
+        return None
+    sandbox = get_sandbox(exercise.schema)
+    if sandbox is None:
+        return None
+    return LocalSQLExecutor(sandbox, db_name, time_limit=exercise.time_limit)
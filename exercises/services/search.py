@@ -0,0 +1,156 @@
+import bisect
+import math
+import re
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+from django.conf import settings
+
+# Words in Latin scripts, one token per character for CJK text
+_TOKEN_RE = re.compile(r'[a-z0-9_]+|[\u3400-\u9fff\uf900-\ufaff]')
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+class SearchIndex:
+    """
+    In-process inverted index over exercise title, description and tags.
+
+    - Every query token is a prefix (search-as-you-type), and all of them
+      must match somewhere in the exercise.
+    - Results are ranked by idf x saturated term weight, where a term in the
+      title counts more than one in the tags, and that more than one in the
+      description; exact term matches beat prefix-only matches.
+    Prefixes are resolved by bisecting a sorted term list, so a lookup costs
+    O(log terms + matches) rather than a scan of every description.
+    """
+
+    FIELD_WEIGHTS = {'title': 3.0, 'tags': 2.0, 'description': 1.0}
+    PREFIX_WEIGHT = 0.6  # a term that only starts with the query token
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[int, float]] = {}   # term -> {exercise id: weight}
+        self._doc_terms: Dict[int, Set[str]] = {}
+        self._terms: List[str] = []                         # sorted keys of _postings
+        self._lock = threading.RLock()
+        self.loaded_at: Optional[float] = None
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    def _add(self, doc_id: int, title: str, description: str, tags: Iterable):
+        weights: Dict[str, float] = {}
+        fields = (('title', title), ('description', description), ('tags', ' '.join(str(t) for t in tags or [])))
+        for field, text in fields:
+            for term in tokenize(text or ''):
+                weights[term] = weights.get(term, 0.0) + self.FIELD_WEIGHTS[field]
+        for term, weight in weights.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                bisect.insort(self._terms, term)
+            postings[doc_id] = weight
+        self._doc_terms[doc_id] = set(weights)
+
+    def _remove(self, doc_id: int):
+        for term in self._doc_terms.pop(doc_id, ()):
+            postings = self._postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+                del self._terms[bisect.bisect_left(self._terms, term)]
+
+    def update(self, doc_id: int, title: str, description: str, tags: Iterable):
+        """Add or re-index one exercise"""
+        with self._lock:
+            self._remove(doc_id)
+            self._add(doc_id, title, description, tags)
+
+    def remove(self, doc_id: int):
+        with self._lock:
+            self._remove(doc_id)
+
+    def rebuild(self, docs: Iterable):
+        """Replace the whole index with (id, title, description, tags) rows"""
+        fresh = SearchIndex()
+        for doc in docs:
+            fresh._add(*doc)
+        with self._lock:
+            self._postings, self._doc_terms, self._terms = fresh._postings, fresh._doc_terms, fresh._terms
+            self.loaded_at = time.monotonic()
+
+    def _expand(self, token: str) -> List[str]:
+        start = bisect.bisect_left(self._terms, token)
+        end = bisect.bisect_left(self._terms, token + '\uffff', start)
+        return self._terms[start:end]
+
+    def search(self, query: str) -> List[int]:
+        """Exercise ids matching every token of `query`, best first"""
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+        with self._lock:
+            total = len(self._doc_terms) or 1
+            scores: Optional[Dict[int, float]] = None
+            for token in tokens:
+                token_scores: Dict[int, float] = {}
+                for term in self._expand(token):
+                    postings = self._postings[term]
+                    idf = math.log(1 + total / len(postings))
+                    boost = 1.0 if term == token else self.PREFIX_WEIGHT
+                    for doc_id, weight in postings.items():
+                        score = idf * boost * weight / (weight + 1.2)
+                        if score > token_scores.get(doc_id, 0.0):
+                            token_scores[doc_id] = score
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {d: s + token_scores[d] for d, s in scores.items() if d in token_scores}
+                if not scores:
+                    return []
+        return sorted(scores, key=lambda d: (-scores[d], d))
+
+
+def _load_documents():
+    from ..models import Exercise
+    return Exercise.objects.values_list('id', 'title', 'description', 'tags').iterator()
+
+
+exercise_search = SearchIndex()
+_load_lock = threading.Lock()
+
+
+def search_exercises(query: str) -> List[int]:
+    """
+    Ranked exercise ids for the list's `search` parameter.
+    The index is built on first use and kept current by the Exercise
+    signals; it is also rebuilt every SEARCH_INDEX_TTL seconds to pick up
+    changes saved by other workers.
+    """
+    loaded_at = exercise_search.loaded_at
+    if loaded_at is None:
+        with _load_lock:
+            if exercise_search.loaded_at is None:
+                exercise_search.rebuild(_load_documents())
+    elif time.monotonic() - loaded_at > getattr(settings, 'SEARCH_INDEX_TTL', 300):
+        # One thread rebuilds; the rest keep searching the current index
+        if _load_lock.acquire(blocking=False):
+            try:
+                exercise_search.rebuild(_load_documents())
+            finally:
+                _load_lock.release()
+    return exercise_search.search(query)
+
+
+def index_exercise(exercise):
+    """post_save hook; a not-yet-built index will pick the row up when it loads"""
+    if exercise_search.loaded_at is not None:
+        exercise_search.update(exercise.id, exercise.title, exercise.description, exercise.tags)
+
+
+def unindex_exercise(exercise_id: int):
+    if exercise_search.loaded_at is not None:
+        exercise_search.remove(exercise_id)
@@ -0,0 +1,121 @@
+import asyncio
+import threading
+from typing import Awaitable, Callable, Dict, Hashable, Tuple
+
+from django.conf import settings
+
+
+def single_flight_enabled() -> bool:
+    return getattr(settings, 'QUERY_SINGLE_FLIGHT', True)
+
+
+class _Call:
+    __slots__ = ('done', 'value', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls with the same key into one execution.
+    The first caller (the leader) runs the function; callers arriving while
+    it is in flight block until it finishes and get the same value or
+    exception. Nothing is remembered afterwards; that is the result cache's job.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self._stats = {'leaders': 0, 'shared': 0}
+
+    def do(self, key: Hashable, fn: Callable) -> Tuple[object, bool]:
+        """Returns (value, shared), `shared` being True for callers that waited"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._stats['shared'] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self._stats['leaders'] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+
+        try:
+            call.value = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value, False
+
+    def stats(self) -> Dict:
+        with self._lock:
+            data = dict(self._stats)
+            data['in_flight'] = len(self._calls)
+            data['waiting'] = sum(c.waiters for c in self._calls.values())
+        return data
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines; calls are shared within one event loop"""
+
+    def __init__(self):
+        self._calls: Dict[Tuple[asyncio.AbstractEventLoop, Hashable], asyncio.Future] = {}
+        self._stats = {'leaders': 0, 'shared': 0}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]) -> Tuple[object, bool]:
+        loop = asyncio.get_running_loop()
+        loop_key = (loop, key)
+        future = self._calls.get(loop_key)
+        if future is not None:
+            self._stats['shared'] += 1
+            try:
+                # shield: a waiter being cancelled must not cancel the leader's work
+                return await asyncio.shield(future), True
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The leader's request went away; run it ourselves
+                return await self.do(key, fn)
+
+        self._stats['leaders'] += 1
+        future = self._calls[loop_key] = loop.create_future()
+        try:
+            value = await fn()
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # Mark retrieved in case nobody was waiting
+                future.exception()
+            raise
+        else:
+            future.set_result(value)
+            return value, False
+        finally:
+            del self._calls[loop_key]
+
+    def stats(self) -> Dict:
+        data = dict(self._stats)
+        data['in_flight'] = len(self._calls)
+        return data
+
+
+# Shared by every SQLExecutor / AsyncSQLExecutor in the process
+inflight_queries = SingleFlight()
+async_inflight_queries = AsyncSingleFlight()
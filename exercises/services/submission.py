@@ -0,0 +1,105 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Tuple
+
+from django.conf import settings
+
+from .result_cache import peek_expected_result, store_expected_result
+
+
+# Threads that run expected_sql while the request thread runs the student's query
+_expected_sql_pool = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'SUBMIT_PARALLEL_WORKERS', 16),
+    thread_name_prefix='expected-sql',
+)
+
+
+def skipped_expected_result() -> Dict:
+    """Placeholder for an expected result that was never computed"""
+    return {
+        'success': False,
+        'error': 'Expected query skipped because the submitted query failed',
+        'columns': [],
+        'rows': [],
+        'row_count': 0,
+        'execution_time': 0
+    }
+
+
+def run_submission(executor, query: str, exercise, db_name: str,
+                   expected_sql: Callable) -> Tuple[Dict, Dict]:
+    """
+    Run the student's query and the exercise's expected query for grading.
+
+    On a cache miss the expected query runs on a second pooled connection
+    in parallel with the student's, so latency is the slower of the two
+    instead of their sum. If the student's query is rejected by validation
+    the expected query is never started; if it fails while executing, the
+    expected query is cancelled (or, if already running, left to finish
+    in the background) and the response does not wait for it. Each query
+    takes its own admission slot while it executes, so an expected query
+    left running in the background still counts against the database,
+    though not against the student's session (SQLExecutor.for_reference).
+
+    `expected_sql(exercise, db_name)` returns the SQL to run for the
+    expected result (e.g. with table names fixed).
+    Returns (user_result, expected_result).
+    """
+    cached = peek_expected_result(exercise, db_name)
+    if cached is not None:
+        return executor.execute(query), cached
+
+    is_valid, _ = executor.validate_query(query)
+    if not is_valid:
+        # execute() re-validates and returns the usual failure dict
+        return executor.execute(query), skipped_expected_result()
+
+    def run_expected():
+        result = executor.for_reference().execute(expected_sql(exercise, db_name), check_plan=False)
+        store_expected_result(exercise, db_name, result)
+        return result
+
+    future = _expected_sql_pool.submit(run_expected)
+    user_result = executor.execute(query)
+
+    if not user_result['success']:
+        # A query that already started can't be interrupted; let it finish
+        # in the background and warm the cache instead of waiting for it
+        future.cancel()
+        return user_result, skipped_expected_result()
+
+    return user_result, future.result()
+
+
+async def arun_submission(executor, query: str, exercise, db_name: str,
+                          expected_sql: Callable) -> Tuple[Dict, Dict]:
+    """
+    Async variant of run_submission for AsyncSQLExecutor.
+    `expected_sql` is a coroutine function; the expected query task is
+    cancelled (and its connection dropped) if the student's query fails.
+    """
+    cached = peek_expected_result(exercise, db_name)
+    if cached is not None:
+        return await executor.aexecute(query), cached
+
+    is_valid, _ = executor.validate_query(query)
+    if not is_valid:
+        return await executor.aexecute(query), skipped_expected_result()
+
+    async def run_expected():
+        return await executor.for_reference().aexecute(await expected_sql(exercise, db_name), check_plan=False)
+
+    expected_task = asyncio.ensure_future(run_expected())
+    try:
+        user_result = await executor.aexecute(query)
+    except BaseException:
+        expected_task.cancel()
+        raise
+
+    if not user_result['success']:
+        expected_task.cancel()
+        return user_result, skipped_expected_result()
+
+    expected_result = await expected_task
+    store_expected_result(exercise, db_name, expected_result)
+    return user_result, expected_result
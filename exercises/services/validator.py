@@ -0,0 +1,206 @@
+import hashlib
+from typing import Tuple
+
+import sqlparse
+from sqlparse import tokens as T
+
+from .result_cache import TTLCache
+
+
+# Keywords that never belong in a read-only practice query. Only tokens the
+# tokenizer classifies as keywords are checked, so identifiers such as
+# created_at or updated no longer trip the check, and neither do strings.
+DANGEROUS_KEYWORDS = {
+    'DROP', 'DELETE', 'UPDATE', 'INSERT', 'REPLACE', 'ALTER', 'CREATE',
+    'TRUNCATE', 'RENAME', 'GRANT', 'REVOKE', 'EXEC', 'EXECUTE', 'CALL',
+    'LOAD', 'HANDLER', 'LOCK', 'UNLOCK', 'INTO', 'OUTFILE', 'DUMPFILE',
+}
+
+# Functions that stall the server, take locks or read server files
+BLOCKED_FUNCTIONS = {
+    'SLEEP', 'BENCHMARK', 'GET_LOCK', 'RELEASE_LOCK', 'RELEASE_ALL_LOCKS',
+    'IS_FREE_LOCK', 'IS_USED_LOCK', 'LOAD_FILE', 'MASTER_POS_WAIT',
+    'SOURCE_POS_WAIT', 'WAIT_FOR_EXECUTED_GTID_SET',
+    'WAIT_UNTIL_SQL_THREAD_AFTER_GTIDS',
+}
+
+# Functions whose value changes from one execution to the next; results of
+# queries that call them are never cached. The SQL-standard ones also work
+# without parentheses (SELECT CURRENT_DATE).
+NONDETERMINISTIC_FUNCTIONS = {
+    'NOW', 'SYSDATE', 'CURDATE', 'CURTIME', 'CURRENT_DATE', 'CURRENT_TIME',
+    'CURRENT_TIMESTAMP', 'LOCALTIME', 'LOCALTIMESTAMP', 'UTC_DATE', 'UTC_TIME',
+    'UTC_TIMESTAMP', 'UNIX_TIMESTAMP', 'RAND', 'UUID', 'UUID_SHORT',
+    'CONNECTION_ID', 'LAST_INSERT_ID', 'FOUND_ROWS', 'ROW_COUNT',
+}
+_NILADIC_FUNCTIONS = {
+    'CURRENT_DATE', 'CURRENT_TIME', 'CURRENT_TIMESTAMP', 'LOCALTIME', 'LOCALTIMESTAMP',
+    'UTC_DATE', 'UTC_TIME', 'UTC_TIMESTAMP',
+}
+
+# (is_valid, error, normalized sql, deterministic) keyed by sha1 of the query text;
+# repeated Run clicks skip parsing
+_verdicts = TTLCache(max_entries=4096, ttl=3600)
+
+
+def _meaningful(tokens):
+    return [t for t in tokens if not t.is_whitespace and t.ttype not in T.Comment]
+
+
+def _check_statement(statement) -> Tuple[bool, str]:
+    tokens = list(statement.flatten())
+
+    # Block comments can carry executable code (/*! ... */) or optimizer hints
+    for tok in tokens:
+        if tok.ttype in T.Comment.Multiline:
+            return False, "Block comments (/* ... */) are not allowed in queries"
+
+    meaningful = _meaningful(tokens)
+
+    # Must be a SELECT, optionally behind WITH or opening parentheses
+    first = next((t for t in meaningful if not (t.ttype in T.Punctuation and t.value == '(')), None)
+    if first is None or first.normalized not in ('SELECT', 'WITH'):
+        return False, "Only SELECT queries are allowed"
+    if statement.get_type() not in ('SELECT', 'UNKNOWN'):
+        return False, "Only SELECT queries are allowed"
+
+    for i, tok in enumerate(meaningful):
+        value = tok.value.upper()
+        if tok.ttype in T.Keyword and value in DANGEROUS_KEYWORDS:
+            return False, f"Keyword '{value}' is not allowed"
+        if value in BLOCKED_FUNCTIONS and (tok.ttype in T.Name or tok.ttype in T.Keyword):
+            nxt = meaningful[i + 1] if i + 1 < len(meaningful) else None
+            if nxt is not None and nxt.ttype in T.Punctuation and nxt.value == '(':
+                return False, f"Function '{value}()' is not allowed"
+
+    return True, ""
+
+
+def _normalize(statement) -> str:
+    """
+    Canonical text of a statement: comments dropped, whitespace collapsed
+    and any trailing semicolon removed.
+
+    Token case is kept: sqlparse lexes many identifiers as keywords
+    (`class`, `user`, `order`), and table names are case-sensitive on
+    MySQL, so `FROM class` and `FROM Class` must not share a cache entry.
+    Top-level select lists also keep their whitespace: MySQL names
+    unaliased result columns after the expression text as written.
+    String literals are never touched.
+    """
+    parts = []
+    pending_space = False
+    verbatim_ws = None  # whitespace held back inside a select list
+    depth = 0
+    verbatim = False
+    for tok in statement.flatten():
+        if tok.ttype in T.Punctuation:
+            if tok.value == '(':
+                depth += 1
+            elif tok.value == ')':
+                depth -= 1
+        elif depth == 0 and tok.ttype in T.Keyword:
+            if tok.normalized == 'SELECT':
+                if pending_space and parts:
+                    parts.append(' ')
+                parts.append(tok.value)
+                pending_space = True
+                verbatim = True
+                verbatim_ws = None
+                continue
+            if tok.normalized in ('FROM', 'UNION', 'INTERSECT', 'EXCEPT'):
+                verbatim = False
+                pending_space = pending_space or verbatim_ws is not None
+
+        if tok.ttype in T.Comment:
+            pending_space = True
+            continue
+        if verbatim:
+            if tok.is_whitespace:
+                verbatim_ws = (verbatim_ws or '') + tok.value
+                continue
+            # Whitespace after SELECT is not part of any column name
+            if pending_space:
+                parts.append(' ')
+            elif verbatim_ws:
+                parts.append(verbatim_ws)
+            parts.append(tok.value)
+            pending_space = False
+            verbatim_ws = None
+            continue
+        if tok.is_whitespace:
+            pending_space = True
+            continue
+        if pending_space and parts:
+            parts.append(' ')
+        pending_space = False
+        # Multi-word keywords such as GROUP BY come through as one token
+        parts.append(' '.join(tok.value.split()) if tok.ttype in T.Keyword else tok.value)
+
+    text = ''.join(parts).strip()
+    while text.endswith(';'):
+        text = text[:-1].rstrip()
+    return text
+
+
+def _deterministic(statement) -> bool:
+    meaningful = _meaningful(statement.flatten())
+    for i, tok in enumerate(meaningful):
+        value = tok.value.upper()
+        if value in NONDETERMINISTIC_FUNCTIONS and (tok.ttype in T.Name or tok.ttype in T.Keyword):
+            nxt = meaningful[i + 1] if i + 1 < len(meaningful) else None
+            if value in _NILADIC_FUNCTIONS or (nxt is not None and nxt.ttype in T.Punctuation and nxt.value == '('):
+                return False
+    return True
+
+
+def _validate(query: str) -> Tuple[bool, str, str, bool]:
+    statements = [s for s in sqlparse.parse(query) if _meaningful(s.flatten())]
+    if not statements:
+        return False, "Only SELECT queries are allowed", '', False
+    if len(statements) > 1:
+        return False, "Multiple statements are not allowed", '', False
+    is_valid, error = _check_statement(statements[0])
+    if not is_valid:
+        return is_valid, error, '', False
+    return is_valid, error, _normalize(statements[0]), _deterministic(statements[0])
+
+
+def _verdict(query: str) -> Tuple[bool, str, str, bool]:
+    key = hashlib.sha1(query.encode('utf-8')).digest()
+    verdict = _verdicts.get(key)
+    if verdict is None:
+        verdict = _validate(query)
+        _verdicts.set(key, verdict)
+    return verdict
+
+
+def validate_sql(query: str) -> Tuple[bool, str]:
+    """
+    Validate that `query` is a single read-only SELECT (CTEs allowed).
+    Returns: (is_valid, error_message)
+    """
+    is_valid, error, _, _ = _verdict(query)
+    return is_valid, error
+
+
+def normalize_sql(query: str) -> str:
+    """
+    Normalized form of a valid query (see _normalize), used as a cache key
+    so whitespace and comment differences share one entry.
+    Returns '' for queries that fail validation.
+    """
+    return _verdict(query)[2]
+
+
+def is_deterministic(query: str) -> bool:
+    """
+    False if a valid query calls a function such as NOW() or RAND() (see
+    NONDETERMINISTIC_FUNCTIONS), so running it twice may give different
+    results. Also False for queries that fail validation.
+    """
+    return _verdict(query)[3]
+
+
+def validator_stats():
+    return _verdicts.stats()
@@ -0,0 +1,129 @@
+import heapq
+import itertools
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import pymysql
+from django.conf import settings
+
+
+def kill_query(db_name: str, thread_id: int, addr: Optional[Tuple[str, int]] = None):
+    """
+    Issue KILL QUERY for a MySQL connection id from a separate connection.
+    A fresh connection is used on purpose: the pool may be exhausted by the
+    very queries that need killing. `addr` is the (host, port) the statement
+    runs on when that isn't the alias's HOST (read replicas).
+    """
+    db_config = settings.DATABASES[db_name]
+    host, port = addr or (db_config.get('HOST'), db_config.get('PORT'))
+    conn = pymysql.connect(
+        host=host,
+        user=db_config.get('USER'),
+        password=db_config.get('PASSWORD'),
+        port=int(port or 3306),
+        connect_timeout=2,
+        read_timeout=2,
+    )
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('KILL QUERY %s', (int(thread_id),))
+    finally:
+        conn.close()
+
+
+class WatchTicket:
+    """Handle for one watched statement; call `done()` once it has finished"""
+
+    __slots__ = ('watchdog', 'db_name', 'thread_id', 'addr', 'deadline', 'state')
+
+    def __init__(self, watchdog, db_name: str, thread_id: int, deadline: float, addr=None):
+        self.watchdog = watchdog
+        self.db_name = db_name
+        self.thread_id = thread_id
+        self.addr = addr
+        self.deadline = deadline
+        self.state = 'active'
+
+    def done(self) -> bool:
+        """
+        Stop watching. Returns True if a KILL QUERY was (or is being) sent,
+        in which case the connection must not be reused: the kill may land
+        after the statement finished and hit the next one instead.
+        """
+        with self.watchdog._cond:
+            killed = self.state == 'killing'
+            self.state = 'done'
+        return killed
+
+
+class QueryWatchdog:
+    """
+    Background thread that kills statements still running past their deadline.
+    Backstop for the server-side max_execution_time limit, which MySQL only
+    applies to SELECT statements and which older servers don't support.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition(threading.Lock())
+        self._thread = None
+        self._stats = {
+            'watched': 0,
+            'kills': 0,
+            'kill_failures': 0,
+            'timeouts': {},
+        }
+
+    def watch(self, db_name: str, thread_id: int, timeout: float, addr=None) -> WatchTicket:
+        ticket = WatchTicket(self, db_name, thread_id, time.monotonic() + timeout, addr)
+        with self._cond:
+            heapq.heappush(self._heap, (ticket.deadline, next(self._counter), ticket))
+            self._stats['watched'] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='query-watchdog', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return ticket
+
+    def record_timeout(self, db_name: str):
+        """Count a statement that ended with a timeout error"""
+        with self._cond:
+            timeouts = self._stats['timeouts']
+            timeouts[db_name] = timeouts.get(db_name, 0) + 1
+
+    def stats(self) -> Dict:
+        with self._cond:
+            data = dict(self._stats)
+            data['timeouts'] = dict(self._stats['timeouts'])
+            data['pending'] = sum(1 for _, _, t in self._heap if t.state == 'active')
+        return data
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    # Finished statements are dropped lazily as they surface
+                    while self._heap and self._heap[0][2].state == 'done':
+                        heapq.heappop(self._heap)
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    wait = self._heap[0][0] - time.monotonic()
+                    if wait <= 0:
+                        break
+                    self._cond.wait(wait)
+                _, _, ticket = heapq.heappop(self._heap)
+                ticket.state = 'killing'
+
+            try:
+                kill_query(ticket.db_name, ticket.thread_id, ticket.addr)
+                ok = True
+            except Exception:
+                ok = False
+            with self._cond:
+                self._stats['kills' if ok else 'kill_failures'] += 1
+
+
+watchdog = QueryWatchdog()
@@ -1,14 +1,41 @@
 from rest_framework.views import APIView
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.utils.encoders import JSONEncoder as DRFJSONEncoder
+from asgiref.sync import sync_to_async
 from django.shortcuts import get_object_or_404
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import patch_vary_headers
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django.utils.decorators import method_decorator
 from django.db import models as dj_models
 from django.utils import timezone
-from .models import DatabaseSchema, Exercise, UserProgress
+from .models import Exercise, UserProgress
 from .services.executor import SQLExecutor
+from .services.async_executor import AsyncSQLExecutor
+from .services.catalog import get_catalog, fixed_expected_sql_cache
+from .services.comparator import has_order_by, order_by_terms
+from .services.sandbox import get_local_executor, SandboxUnsupported
+from .services.regrade import regrade_exercise
+from .services.listing import (
+    schema_listing, exercise_catalog, etag_matches, parse_fields, encode_cursor, decode_cursor,
+    render_json, body_etag,
+)
+from .services.search import search_exercises
+from .services.progress import completion_bitmap, is_completed
+from .services.admission import admission
+from .services.pool import pool_stats
+from .services.result_cache import cache_stats
+from .services.singleflight import inflight_queries, async_inflight_queries
+from .services.validator import validator_stats
+from .services.watchdog import watchdog
+from .services.submission import run_submission, arun_submission
+import hashlib
+import json
 import uuid
 import re
-import pymysql
 from django.db import connection
 from django.conf import settings
 
@@ -43,57 +70,181 @@ def fix_table_names_in_sql(sql, db_name):
     user = db_config.get('USER')
     password = db_config.get('PASSWORD')
     database = db_config.get('NAME')
-    port = int(db_config.get('PORT', 3306))
     
     if not all([host, user, password, database]):
         return sql
     
-    try:
-        # 连接到数据库获取实际表名
-        conn = pymysql.connect(
-            host=host,
-            user=user,
-            password=password,
-            database=database,
-            port=port,
-            connect_timeout=2
-        )
-        with conn.cursor() as cursor:
-            cursor.execute("SHOW TABLES")
-            actual_tables = {row[0].lower(): row[0] for row in cursor.fetchall()}
-        conn.close()
-        
-        # 替换 SQL 中的表名
-        def replace_table_name(match):
-            table_name = match.group(0)
-            table_lower = table_name.lower()
-            if table_lower in actual_tables:
-                return actual_tables[table_lower]
-            return table_name
-        
-        # 匹配 SQL 中的表名（考虑引号、反引号等）
-        # 匹配 FROM, JOIN, UPDATE, INSERT INTO, DELETE FROM 后的表名
-        pattern = r'\b(?:FROM|JOIN|UPDATE|INTO|TABLE)\s+[`"]?(\w+)[`"]?'
-        fixed_sql = re.sub(pattern, lambda m: m.group(0).replace(m.group(1), actual_tables.get(m.group(1).lower(), m.group(1))), sql, flags=re.IGNORECASE)
-        
-        return fixed_sql
-    except Exception:
-        # 如果无法连接或修复失败，返回原始 SQL
+    # 使用进程内缓存的表名目录，而不是每次提交都执行 SHOW TABLES
+    catalog = get_catalog(db_name)
+    if catalog is None:
+        # 如果无法连接或加载失败，返回原始 SQL
         return sql
+    actual_tables = catalog.tables
+    
+    # 匹配 SQL 中的表名（考虑引号、反引号等）
+    # 匹配 FROM, JOIN, UPDATE, INSERT INTO, DELETE FROM 后的表名
+    pattern = r'\b(?:FROM|JOIN|UPDATE|INTO|TABLE)\s+[`"]?(\w+)[`"]?'
+    return re.sub(pattern, lambda m: m.group(0).replace(m.group(1), actual_tables.get(m.group(1).lower(), m.group(1))), sql, flags=re.IGNORECASE)
+
+def get_fixed_expected_sql(exercise, db_name):
+    """
+    返回修复过表名大小写的 expected_sql，按 (题目, expected_sql, 数据库, 目录版本) 缓存
+    """
+    catalog = get_catalog(db_name)
+    if catalog is None:
+        return exercise.expected_sql
+    key = (exercise.id, hashlib.sha1(exercise.expected_sql.encode('utf-8')).hexdigest(), db_name, catalog.version)
+    fixed_sql = fixed_expected_sql_cache.get(key)
+    if fixed_sql is None:
+        fixed_sql = fix_table_names_in_sql(exercise.expected_sql, db_name)
+        fixed_expected_sql_cache.set(key, fixed_sql)
+    return fixed_sql
+
+def run_on_default_db(query):
+    """
+    在默认数据库（本地 SQLite）上执行查询，用于练习数据库未配置时的回退
+    返回与 SQLExecutor.execute 相同结构的结果
+    """
+    start = timezone.now()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(query)
+            rows = cursor.fetchmany(SQLExecutor.MAX_ROWS)
+            columns = [col[0] for col in cursor.description] if cursor.description else []
+            truncated = len(rows) == SQLExecutor.MAX_ROWS and cursor.fetchone() is not None
+        exec_time = (timezone.now() - start).total_seconds()
+        return {
+            'success': True,
+            'columns': columns,
+            'rows': rows,
+            'row_count': len(rows),
+            'truncated': truncated,
+            'execution_time': round(exec_time, 3),
+            'error': None
+        }
+    except Exception as e:
+        exec_time = (timezone.now() - start).total_seconds()
+        return {
+            'success': False,
+            'error': str(e),
+            'columns': [],
+            'rows': [],
+            'row_count': 0,
+            'execution_time': round(exec_time, 3)
+        }
+
+def track_attempt(session_id, exercise, query):
+    """Update or create progress: increment attempts if exists, else create with attempts=1"""
+    try:
+        up = UserProgress.objects.get(session_id=session_id, exercise=exercise)
+        up.last_query = query
+        up.attempts = dj_models.F('attempts') + 1
+        up.save(update_fields=['last_query', 'attempts'])
+    except UserProgress.DoesNotExist:
+        UserProgress.objects.create(session_id=session_id, exercise=exercise, last_query=query, attempts=1)
+
+def mark_completed(session_id, exercise, query):
+    UserProgress.objects.update_or_create(
+        session_id=session_id,
+        exercise=exercise,
+        defaults={
+            'completed': True,
+            'last_query': query,
+            'completed_query': query,
+            'completed_at': timezone.now()
+        }
+    )
+
+def run_locally(exercise, db_name, *queries):
+    """
+    在本地 SQLite 沙箱中执行（settings.SQL_LOCAL_SANDBOX），不经过 MySQL
+    Returns (executor, results); (None, None) if the sandbox is off or any
+    of the queries needs MySQL, so Submit never mixes the two engines.
+    """
+    executor = get_local_executor(exercise, db_name)
+    if executor is None:
+        return None, None
+    try:
+        return executor, [executor.execute(q) for q in queries]
+    except SandboxUnsupported:
+        return None, None
+
+def compare_submission(executor, user_result, expected_result, exercise):
+    if executor:
+        # 期望 SQL 带 ORDER BY 时，行顺序也参与判分；数值精度、大小写等按题目的 grading_options 处理
+        return executor.compare_results(user_result, expected_result,
+                                        ordered=has_order_by(exercise.expected_sql),
+                                        order_by=order_by_terms(exercise.expected_sql),
+                                        options=exercise.grading_options)
+    # 如果无法创建 executor，进行简单比较
+    return {
+        'correct': user_result['success'] and expected_result['success'] and 
+                  user_result.get('row_count') == expected_result.get('row_count'),
+        'message': 'Results compared (fallback mode)' if user_result['success'] and expected_result['success'] else 'Query execution failed'
+    }
+
+def client_key(request):
+    """准入控制按会话计数；还没有会话时返回 ''，只受每个数据库的并发上限约束"""
+    return request.session.session_key or ''
+
+def throttled(*results):
+    """
+    429 body and headers if one of the results couldn't get an execution
+    slot (see services/admission.py), otherwise (None, None)
+    """
+    for result in results:
+        if result.get('error_type') == 'throttled':
+            return {'error': result['error'], 'error_type': 'throttled'}, {'Retry-After': str(result['retry_after'])}
+    return None, None
+
+def representation_response(request, rep):
+    """Pre-serialized JSON body; 304 on a matching If-None-Match, gzip when the client accepts it"""
+    use_gzip = 'gzip' in request.headers.get('Accept-Encoding', '')
+    etag = rep.gzip_etag if use_gzip else rep.etag
+    if_none_match = request.headers.get('If-None-Match', '')
+    if etag_matches(if_none_match, rep.etag) or etag_matches(if_none_match, rep.gzip_etag):
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = HttpResponse(rep.gzip_body if use_gzip else rep.body, content_type='application/json')
+        if use_gzip:
+            response['Content-Encoding'] = 'gzip'
+    response['ETag'] = etag
+    response['Vary'] = 'Accept-Encoding'
+    return response
+
+def json_etag_response(request, data):
+    """JSON response with a content ETag, 304 on a matching If-None-Match"""
+    body = render_json(data)
+    etag = body_etag(body)
+    if etag_matches(request.headers.get('If-None-Match', ''), etag):
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    return response
+
+def regrade(exercise, revoke=False, workers=None):
+    """
+    按当前 expected_sql 重新判定该题的全部提交（见 services/regrade.py）
+    耗时与提交数成正比，只通过 manage.py regrade_exercise 运行，不在请求中执行
+    """
+    db_name = get_db_name_for_exercise(exercise)
+    try:
+        executor = SQLExecutor(db_name, time_limit=exercise.time_limit)
+    except ValueError as e:
+        return {'error': str(e)}
+    return regrade_exercise(executor, exercise, db_name, get_fixed_expected_sql,
+                            revoke=revoke, workers=workers)
 
 class SchemaListView(APIView):
     """GET /api/schemas/ - List all database schemas"""
     
     def get(self, request):
-        schemas = DatabaseSchema.objects.all()
-        data = [{
-            'id': s.id,
-            'name': s.name,
-            'display_name': s.display_name,
-            'description': s.description,
-            'exercise_count': s.exercises.count()
-        } for s in schemas]
-        return Response(data)
+        # 缓存的列表（见 services/listing.py）；If-None-Match 命中时直接 304，不查数据库
+        data, etag = schema_listing.get()
+        if etag_matches(request.headers.get('If-None-Match', ''), etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        return Response(data, headers={'ETag': etag})
 
 class ExerciseListView(APIView):
     """
@@ -101,55 +252,58 @@ class ExerciseListView(APIView):
     支持的筛选参数（全部可选）：
       - schema_id: 按 schema 过滤
       - difficulty: 难度（easy/medium/hard）
-      - search: 关键字，模糊匹配 title / description / tags
+      - search: 关键字，按前缀匹配 title / description / tags，结果按相关度排序（services/search.py）
+      - fields: 只返回这些字段，逗号分隔（id 总是返回），如 fields=title,difficulty
+      - limit / cursor: 按 (order, id) 的 keyset 分页；带上其中之一时返回
+        {"results": [...], "next": cursor 或 null}，把 next 作为下一页的 cursor。
+        搜索结果按相关度排序，只支持 limit
+    列表来自内存中的题目快照（services/listing.py），稳定状态下不查数据库；
+    completed 来自当前 session 的完成位图（services/progress.py），每个请求一次查询，不做跨请求缓存
     """
+    MAX_PAGE_SIZE = 200
     
     def get(self, request):
-        exercises = Exercise.objects.select_related('schema').all()
-        
-        # 动态拼接 filter 条件
-        filters = {}
-        
-        # Filter by schema
+        catalog, _ = exercise_catalog.get()
         schema_id = request.query_params.get('schema_id')
-        if schema_id:
-            filters['schema_id'] = schema_id
-        
-        # Filter by difficulty
         difficulty = request.query_params.get('difficulty')
-        if difficulty:
-            filters['difficulty'] = difficulty
-        
-        if filters:
-            exercises = exercises.filter(**filters)
-        
-        # 关键字搜索（动态 SQL 条件：使用 Q 对象组合）
         search = request.query_params.get('search')
-        if search:
-            exercises = exercises.filter(
-                dj_models.Q(title__icontains=search) |
-                dj_models.Q(description__icontains=search) |
-                dj_models.Q(tags__icontains=search)
-            )
+        limit = request.query_params.get('limit')
+        cursor = request.query_params.get('cursor')
         
-        # 确保按照 order 字段排序（从小到大），order 相同时按 id 排序
-        exercises = exercises.order_by('order', 'id')
-        
-        data = [{
-            'id': ex.id,
-            'title': ex.title,
-            'difficulty': ex.difficulty,
-            'order': ex.order,  # 包含 order 字段，用于前端排序
-            'schema': {
-                'id': ex.schema.id,
-                'name': ex.schema.name,
-                'display_name': ex.schema.display_name,
-            },
-            'tags': ex.tags,
-            'completed': False  # TODO: Check user progress
-        } for ex in exercises]
+        try:
+            fields = parse_fields(request.query_params.get('fields'))
+            after = decode_cursor(cursor) if cursor else None
+            if limit:
+                if not limit.isdecimal() or not 1 <= int(limit) <= self.MAX_PAGE_SIZE:
+                    raise ValueError(f'limit must be between 1 and {self.MAX_PAGE_SIZE}')
+                limit = int(limit)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if search and after:
+            return Response({'error': 'cursor is not supported with search; use limit'},
+                            status=status.HTTP_400_BAD_REQUEST)
         
-        return Response(data)
+        bits = completion_bitmap(request.session.session_key)
+        if not (search or fields or limit or cursor or bits):
+            response = representation_response(request, catalog.representation(schema_id, difficulty))
+        else:
+            # 搜索、分页、字段裁剪和完成状态随请求变化，不预先序列化
+            positions = catalog.select(schema_id, difficulty, search_exercises(search) if search else None)
+            positions, next_key = catalog.page(positions, after, limit or None)
+            entries = [catalog.entries[p] for p in positions]
+            if bits:
+                entries = [dict(e, completed=True) if is_completed(bits, e['id']) else e for e in entries]
+            if fields:
+                entries = [{f: entry[f] for f in fields} for entry in entries]
+            if limit or cursor:
+                entries = {
+                    'results': entries,
+                    'next': encode_cursor(next_key) if next_key and not search else None,
+                }
+            response = json_etag_response(request, entries)
+        # 同一 URL 的内容因 session 而异
+        patch_vary_headers(response, ['Cookie'])
+        return response
 
 class ExerciseDetailView(APIView):
     """GET /api/exercises/{id}/ - Get exercise details"""
@@ -191,37 +345,20 @@ class ExecuteQueryView(APIView):
         # Execute query using SQLExecutor if configured, otherwise run against default DB
         # 根据题目标题选择对应的 WS 数据库
         db_name = get_db_name_for_exercise(exercise)
-        try:
-            executor = SQLExecutor(db_name)
-            result = executor.execute(query)
-        except ValueError:
-            # Fallback: execute against default DB (SQLite) using Django connection
-            start = timezone.now()
+        _, local_results = run_locally(exercise, db_name, query)
+        if local_results:
+            result = local_results[0]
+        else:
             try:
-                with connection.cursor() as cursor:
-                    cursor.execute(query)
-                    rows = cursor.fetchmany(SQLExecutor.MAX_ROWS)
-                    columns = [col[0] for col in cursor.description] if cursor.description else []
-                    row_list = [list(row) for row in rows]
-                exec_time = (timezone.now() - start).total_seconds()
-                result = {
-                    'success': True,
-                    'columns': columns,
-                    'rows': row_list,
-                    'row_count': len(row_list),
-                    'execution_time': round(exec_time, 3),
-                    'error': None
-                }
-            except Exception as e:
-                exec_time = (timezone.now() - start).total_seconds()
-                result = {
-                    'success': False,
-                    'error': str(e),
-                    'columns': [],
-                    'rows': [],
-                    'row_count': 0,
-                    'execution_time': round(exec_time, 3)
-                }
+                executor = SQLExecutor(db_name, time_limit=exercise.time_limit, client=client_key(request))
+                result = executor.execute(query)
+            except ValueError:
+                # Fallback: execute against default DB (SQLite) using Django connection
+                result = run_on_default_db(query)
+        
+        body, headers = throttled(result)
+        if body:
+            return Response(body, status=status.HTTP_429_TOO_MANY_REQUESTS, headers=headers)
         
         # Track attempt (get or create session)
         session_id = request.session.session_key
@@ -229,14 +366,7 @@ class ExecuteQueryView(APIView):
             request.session.create()
             session_id = request.session.session_key
         
-        # Update or create progress: increment attempts if exists, else create with attempts=1
-        try:
-            up = UserProgress.objects.get(session_id=session_id, exercise=exercise)
-            up.last_query = query
-            up.attempts = dj_models.F('attempts') + 1
-            up.save(update_fields=['last_query', 'attempts'])
-        except UserProgress.DoesNotExist:
-            UserProgress.objects.create(session_id=session_id, exercise=exercise, last_query=query, attempts=1)
+        track_attempt(session_id, exercise, query)
         
         return Response(result)
 
@@ -256,72 +386,38 @@ class SubmitQueryView(APIView):
         # Execute both user query and expected query, with fallback to default DB
         # 根据题目标题选择对应的 WS 数据库
         db_name = get_db_name_for_exercise(exercise)
-        executor = None
-        try:
-            executor = SQLExecutor(db_name)
-            user_result = executor.execute(query)
-            # 尝试修复期望 SQL 中的表名大小写问题
-            fixed_expected_sql = fix_table_names_in_sql(exercise.expected_sql, db_name)
-            expected_result = executor.execute(fixed_expected_sql)
-        except ValueError:
-            # Fallback execution on default DB
-            def run_on_default(q):
-                start = timezone.now()
-                try:
-                    with connection.cursor() as cursor:
-                        cursor.execute(q)
-                        rows = cursor.fetchmany(SQLExecutor.MAX_ROWS)
-                        columns = [col[0] for col in cursor.description] if cursor.description else []
-                        row_list = [list(row) for row in rows]
-                    exec_time = (timezone.now() - start).total_seconds()
-                    return {
-                        'success': True,
-                        'columns': columns,
-                        'rows': row_list,
-                        'row_count': len(row_list),
-                        'execution_time': round(exec_time, 3),
-                        'error': None
-                    }
-                except Exception as e:
-                    exec_time = (timezone.now() - start).total_seconds()
-                    return {
-                        'success': False,
-                        'error': str(e),
-                        'columns': [],
-                        'rows': [],
-                        'row_count': 0,
-                        'execution_time': round(exec_time, 3)
-                    }
-
-            user_result = run_on_default(query)
-            expected_result = run_on_default(exercise.expected_sql)
-            # 创建临时 executor 用于比较结果
-            executor = SQLExecutor(db_name) if db_name in settings.DATABASES else None
+        # 两条查询都能在本地沙箱执行时不访问 MySQL
+        executor, local_results = run_locally(exercise, db_name, query, exercise.expected_sql)
+        if local_results:
+            user_result, expected_result = local_results
+        else:
+            try:
+                # 每条实际执行的查询各占一个准入名额；期望查询只计入数据库的上限，不占学生会话的名额
+                executor = SQLExecutor(db_name, time_limit=exercise.time_limit, client=client_key(request))
+                # 期望结果按 (题目, expected_sql, 数据库) 缓存，命中时只需执行学生的查询
+                # 未命中时与学生的查询并行执行（先修复期望 SQL 中的表名大小写问题）
+                user_result, expected_result = run_submission(
+                    executor, query, exercise, db_name, get_fixed_expected_sql
+                )
+            except ValueError:
+                # Fallback execution on default DB
+                user_result = run_on_default_db(query)
+                expected_result = run_on_default_db(exercise.expected_sql)
+                # 创建临时 executor 用于比较结果
+                executor = SQLExecutor(db_name, time_limit=exercise.time_limit) if db_name in settings.DATABASES else None
+        
+        body, headers = throttled(user_result, expected_result)
+        if body:
+            return Response(body, status=status.HTTP_429_TOO_MANY_REQUESTS, headers=headers)
         
         # Compare results
-        if executor:
-            comparison = executor.compare_results(user_result, expected_result)
-        else:
-            # 如果无法创建 executor，进行简单比较
-            comparison = {
-                'correct': user_result['success'] and expected_result['success'] and 
-                          user_result.get('row_count') == expected_result.get('row_count'),
-                'message': 'Results compared (fallback mode)' if user_result['success'] and expected_result['success'] else 'Query execution failed'
-            }
+        comparison = compare_submission(executor, user_result, expected_result, exercise)
         
         # Update progress
         session_id = request.session.session_key or str(uuid.uuid4())
         
         if comparison['correct']:
-            UserProgress.objects.update_or_create(
-                session_id=session_id,
-                exercise=exercise,
-                defaults={
-                    'completed': True,
-                    'last_query': query,
-                    'completed_at': timezone.now()
-                }
-            )
+            mark_completed(session_id, exercise, query)
         
         return Response({
             'correct': comparison['correct'],
@@ -329,3 +425,130 @@ class SubmitQueryView(APIView):
             'user_result': user_result,
             'diff': comparison.get('diff')
         })
+
+
+class ExecutionStatsView(APIView):
+    """GET /api/stats/ - Pool, queue, cache and watchdog counters for the practice databases (staff only)"""
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        return Response({
+            'admission': admission.stats(),
+            'pools': pool_stats(),
+            'watchdog': watchdog.stats(),
+            'caches': cache_stats(),
+            'validator': validator_stats(),
+            'single_flight': {
+                'sync': inflight_queries.stats(),
+                'async': async_inflight_queries.stats(),
+            },
+        })
+
+
+# ============================================
+# Async views (SQL_EXECUTION_MODE = 'async', served under ASGI)
+# ============================================
+
+def parse_query_body(request):
+    """从 JSON 请求体中读取 query，返回 (query, error_response)"""
+    try:
+        payload = json.loads(request.body or b'{}')
+    except ValueError:
+        return None, JsonResponse({'detail': 'JSON parse error'}, status=status.HTTP_400_BAD_REQUEST)
+    query = (payload.get('query') or '').strip() if isinstance(payload, dict) else ''
+    if not query:
+        return None, JsonResponse({'error': 'Query is required'}, status=status.HTTP_400_BAD_REQUEST)
+    return query, None
+
+async def aget_exercise(exercise_id):
+    try:
+        return await Exercise.objects.select_related('schema').aget(id=exercise_id)
+    except Exercise.DoesNotExist:
+        return None
+
+def api_response(data, status_code=200, headers=None):
+    # 使用 DRF 的 JSONEncoder，与 Response 的序列化行为一致（Decimal、datetime、bytes 等）
+    return JsonResponse(data, status=status_code, headers=headers, encoder=DRFJSONEncoder,
+                        json_dumps_params={'ensure_ascii': False})
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncExecuteQueryView(View):
+    """POST /api/exercises/{id}/execute/ - Execute user query without holding a worker thread"""
+    
+    async def post(self, request, exercise_id):
+        exercise = await aget_exercise(exercise_id)
+        if exercise is None:
+            return api_response({'detail': 'No Exercise matches the given query.'}, status.HTTP_404_NOT_FOUND)
+        query, error_response = parse_query_body(request)
+        if error_response:
+            return error_response
+        
+        db_name = get_db_name_for_exercise(exercise)
+        _, local_results = await sync_to_async(run_locally)(exercise, db_name, query)
+        if local_results:
+            result = local_results[0]
+        else:
+            try:
+                executor = AsyncSQLExecutor(db_name, time_limit=exercise.time_limit, client=client_key(request))
+            except ValueError:
+                result = await sync_to_async(run_on_default_db)(query)
+            else:
+                result = await executor.aexecute(query)
+        
+        body, headers = throttled(result)
+        if body:
+            return api_response(body, status.HTTP_429_TOO_MANY_REQUESTS, headers)
+        
+        session_id = request.session.session_key
+        if not session_id:
+            await sync_to_async(request.session.create)()
+            session_id = request.session.session_key
+        
+        await sync_to_async(track_attempt)(session_id, exercise, query)
+        
+        return api_response(result)
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncSubmitQueryView(View):
+    """POST /api/exercises/{id}/submit/ - Submit and validate query without holding a worker thread"""
+    
+    async def post(self, request, exercise_id):
+        exercise = await aget_exercise(exercise_id)
+        if exercise is None:
+            return api_response({'detail': 'No Exercise matches the given query.'}, status.HTTP_404_NOT_FOUND)
+        query, error_response = parse_query_body(request)
+        if error_response:
+            return error_response
+        
+        db_name = get_db_name_for_exercise(exercise)
+        executor, local_results = await sync_to_async(run_locally)(exercise, db_name, query, exercise.expected_sql)
+        if local_results:
+            user_result, expected_result = local_results
+        else:
+            try:
+                executor = AsyncSQLExecutor(db_name, time_limit=exercise.time_limit, client=client_key(request))
+            except ValueError:
+                executor = None
+                user_result = await sync_to_async(run_on_default_db)(query)
+                expected_result = await sync_to_async(run_on_default_db)(exercise.expected_sql)
+            else:
+                user_result, expected_result = await arun_submission(
+                    executor, query, exercise, db_name, sync_to_async(get_fixed_expected_sql)
+                )
+        
+        body, headers = throttled(user_result, expected_result)
+        if body:
+            return api_response(body, status.HTTP_429_TOO_MANY_REQUESTS, headers)
+        
+        comparison = compare_submission(executor, user_result, expected_result, exercise)
+        
+        session_id = request.session.session_key or str(uuid.uuid4())
+        if comparison['correct']:
+            await sync_to_async(mark_completed)(session_id, exercise, query)
+        
+        return api_response({
+            'correct': comparison['correct'],
+            'message': comparison['message'],
+            'user_result': user_result,
+            'diff': comparison.get('diff')
+        })